@@ -0,0 +1,174 @@
+import os
+import sys
+import json
+import glob
+import fnmatch
+import argparse
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import loader
+from histogram import LogHistogram, Moments, PERCENTILES, DIRECTIONS
+from analyze_ac import estimate_period, stack_slots, DEFAULT_PERIOD
+
+input_folder = "results_client"
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+LOSS_FIELDS = ('sent', 'received', 'lost', 'late', 'duplicates', 'reordered')
+
+def find_runs(experiments, since=None, until=None):
+    # [(start, exp_number, config)] of the matching runs, in experiment_starts order
+    runs = []
+    for exp_dir in glob.glob(os.path.join(input_folder, "exp_*")):
+        exp_number = os.path.basename(exp_dir)[len("exp_"):]
+        config_path = os.path.join(exp_dir, "client_config.json")
+        if not any(fnmatch.fnmatch(exp_number, pattern) for pattern in experiments):
+            continue
+        if not os.path.exists(config_path):
+            print(f"Skipping exp_{exp_number}: no client_config.json")
+            continue
+        with open(config_path, 'r') as f:
+            config = json.load(f)
+        try:
+            start = datetime.strptime(config["experiment_starts"], TIME_FORMAT)
+        except (KeyError, ValueError):
+            print(f"Skipping exp_{exp_number}: no experiment_starts")
+            continue
+        if (since and start < since) or (until and start >= until):
+            continue
+        runs.append((start, exp_number, config))
+    return sorted(runs, key=lambda run: run[0])
+
+class RunSummary:
+    # Mergeable sketches of one run, or of a pool of runs: latency histograms (ns), loss
+    # counters and the moments of the reconfiguration gaps (ms). Fixed size whatever the length
+    def __init__(self):
+        self.latency = {d: LogHistogram() for d in DIRECTIONS}
+        self.loss = dict.fromkeys(LOSS_FIELDS, 0)
+        self.gaps = Moments()
+        self.periods = Moments()
+
+    def merge(self, other):
+        for direction in DIRECTIONS:
+            self.latency[direction].merge(other.latency[direction])
+        for field in LOSS_FIELDS:
+            self.loss[field] += other.loss[field]
+        self.gaps.merge(other.gaps)
+        self.periods.merge(other.periods)
+
+    def row(self):
+        row = {field: self.loss[field] for field in LOSS_FIELDS}
+        row["loss_pct"] = 100 * self.loss["lost"] / self.loss["sent"] if self.loss["sent"] else None
+        for direction in DIRECTIONS:
+            hist = self.latency[direction]
+            for q in PERCENTILES:
+                row[f"{direction}_p{q:g}_ms"] = hist.percentile(q) / 1e6 if hist.total else None
+            row[f"{direction}_max_ms"] = hist.max / 1e6 if hist.total else None
+        row["period_s"] = self.periods.mean if self.periods.count else None
+        row["gap_count"] = self.gaps.count
+        row["gap_mean_ms"] = self.gaps.mean if self.gaps.count else None
+        row["gap_std_ms"] = self.gaps.std
+        row["gap_min_ms"] = self.gaps.min
+        row["gap_max_ms"] = self.gaps.max
+        return row
+
+    def to_dict(self):
+        return {
+            "latency": {d: self.latency[d].to_dict() for d in DIRECTIONS},
+            "loss": self.loss,
+            "gaps": self.gaps.to_dict(),
+            "periods": self.periods.to_dict(),
+        }
+
+def record_gaps(summary, t, signal, period=None, max_lag_s=60.0, W=150):
+    # Same slotting as analyze_ac.py on one series: t in s, signal = uplink latency in ms
+    if len(t) < 2:
+        return
+    if period is None:
+        period, _, _ = estimate_period(t, signal, max_lag_s)
+        period = period or DEFAULT_PERIOD
+    summary.periods.record_array([period])
+    slot_length = int(round(period / np.median(np.diff(t))))
+    if slot_length > 0:
+        _, _, gaps = stack_slots(signal, slot_length, W)
+        summary.gaps.record_array(gaps)
+
+def summarize_run(exp_number, config, period=None, max_lag_s=60.0):
+    # One series in memory at a time. Latency comes from the histograms the client saved,
+    # loss from its inflight counters; both are rebuilt from the series for older runs
+    summary = RunSummary()
+    exp_dir = loader.exp_path(exp_number)
+    histogram_path = os.path.join(exp_dir, "latency_histogram.json")
+    saved_latency = os.path.exists(histogram_path)
+    if saved_latency:
+        with open(histogram_path, 'r') as f:
+            saved = json.load(f)
+        summary.latency = {d: LogHistogram.from_dict(saved[d]) for d in DIRECTIONS}
+    saved_loss = "inflight" in config
+    if saved_loss:
+        summary.loss.update({field: config["inflight"].get(field, 0) for field in LOSS_FIELDS})
+
+    seq_min, seq_max, rows = None, None, 0
+    for series_number in loader.series_numbers(exp_dir):
+        raw = loader.load_raw(exp_number, series_number)
+        seq, t_send, t_server, t_recv = (raw[name] for name in loader.RAW_COLUMNS)
+        if not len(seq):
+            continue
+        if not saved_latency:
+            for direction, values in zip(DIRECTIONS, (t_server - t_send, t_recv - t_server, t_recv - t_send)):
+                summary.latency[direction].record_array(values)
+        seq_min = int(seq.min()) if seq_min is None else min(seq_min, int(seq.min()))
+        seq_max = int(seq.max()) if seq_max is None else max(seq_max, int(seq.max()))
+        rows += len(seq)
+        record_gaps(summary, (t_send - t_send[0]) / 1e9, (t_server - t_send) / 1e6, period, max_lag_s)
+
+    if not saved_loss and rows:
+        # Only echoed packets are stored: the holes in the seq range are the losses
+        summary.loss["sent"] = seq_max - seq_min + 1
+        summary.loss["received"] = rows
+        summary.loss["lost"] = max(0, summary.loss["sent"] - rows)
+    return summary
+
+def parse_time(value):
+    return datetime.strptime(value, TIME_FORMAT)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-run and pooled summary of a campaign of experiments")
+    parser.add_argument('experiments', nargs='*', default=['*'],
+                        help='Experiment number globs (default: all)')
+    parser.add_argument('--since', type=parse_time, metavar='"YYYY-MM-DD HH:MM:SS"',
+                        help='Only runs whose experiment_starts is at or after this time')
+    parser.add_argument('--until', type=parse_time, metavar='"YYYY-MM-DD HH:MM:SS"',
+                        help='Only runs whose experiment_starts is before this time')
+    parser.add_argument('--period', type=float, help='Slot period in seconds instead of the estimated one')
+    parser.add_argument('--max-lag', type=float, default=60.0,
+                        help='Longest autocorrelation lag searched for the period (s)')
+    parser.add_argument('--output', default=os.path.join(input_folder, "campaign_summary.csv"),
+                        help='Summary table; the pooled sketches go to <output>.json')
+    args = parser.parse_args()
+
+    runs = find_runs(args.experiments, args.since, args.until)
+    if not runs:
+        sys.exit("No runs found")
+
+    pooled = RunSummary()
+    rows = []
+    for start, exp_number, config in runs:
+        summary = summarize_run(exp_number, config, args.period, args.max_lag)
+        pooled.merge(summary)
+        row = summary.row()
+        rows.append({"exp": exp_number, "experiment_starts": start.strftime(TIME_FORMAT), **row})
+        loss = f"{row['loss_pct']:.3f}%" if row['loss_pct'] is not None else "n/a"
+        rtt = f"{row['rtt_p50_ms']:.3f}" if row['rtt_p50_ms'] is not None else "n/a"
+        print(f"exp_{exp_number} ({rows[-1]['experiment_starts']}): loss {loss}, "
+              f"rtt p50 {rtt} ms, {row['gap_count']} gaps")
+    rows.append({"exp": "pooled", "experiment_starts": runs[0][0].strftime(TIME_FORMAT), **pooled.row()})
+
+    table = pd.DataFrame(rows)
+    table.to_csv(args.output, index=False)
+    with open(os.path.splitext(args.output)[0] + ".json", 'w') as f:
+        json.dump({"runs": [exp_number for _, exp_number, _ in runs], **pooled.to_dict()}, f)
+    print(table.iloc[-1].to_string())
+    print(f"{len(runs)} runs summarized in {args.output}")
@@ -1,155 +1,229 @@
 import numpy as np
 import json
 import matplotlib.pyplot as plt
-import pandas as pd
 import os
 import sys
+import argparse
+from scipy.fft import rfft, irfft, next_fast_len
 from scipy.signal import find_peaks
+import loader
 
-# --- Argument parsing for experiment and series number ---
 input_folder = "results_client"
 
-series_number = "1"
-if len(sys.argv) == 2:
-    exp_number = sys.argv[1]
-elif len(sys.argv) == 3:
-    exp_number = sys.argv[1]
-    series_number = sys.argv[2]
-else:
-    exp_number = input("Enter experiment number: ").strip()
-    series_number = input("Enter series number: ").strip()
-
-filename = "series_" + series_number + "_processed.csv"
-processed_file_path = os.path.join(input_folder, "exp_" + exp_number, filename)
-
-# --- Load data ---
-df = pd.read_csv(processed_file_path)
-t = df["sent_at"].values / 1000.0  # convert ms to seconds
-signal = df["sender_to_receiver"].values
-
-# --- Autocorrelation to estimate period ---
-signal_demean = signal - np.mean(signal)
-autocorr = np.correlate(signal_demean, signal_demean, mode='full')
-autocorr = autocorr[autocorr.size // 2:]  # keep only positive lags
-
-lags = np.arange(len(autocorr)) * np.median(np.diff(t))
-peaks, _ = find_peaks(autocorr[1:], height=np.mean(autocorr[1:]) + 4 * np.std(signal), distance=1000)
-if len(peaks) > 0:
-    period_idx = peaks[0] + 1
-    estimated_period = lags[period_idx]
-else:
-    estimated_period = 15  # fallback if no peak found
-
-# Force period if desired
-estimated_period = 15
-
-print(f"Estimated period: {estimated_period:.2f} seconds")
-print(f"Peaks detected: {len(peaks)}")
-
-# --- Slotting ---
-slot_length = int(round(estimated_period / np.median(np.diff(t))))
-print(f"Slot length in samples: {slot_length}")
-n_slots = len(signal) // slot_length
-slots = [signal[i*slot_length:(i+1)*slot_length] for i in range(n_slots) if len(signal[i*slot_length:(i+1)*slot_length]) == slot_length]
-
-print(f"Number of slots with peaks: {len(slots)}")
-
-# --- Stack windows centered on the peak of each slot ---
-W = 150  # points before and after the peak (window size = 2*W+1)
-stacked = []
-for slot in slots:
-    peak_idx = np.argmax(slot)
-    # Ensure window fits within slot
-    if peak_idx - W < 0 or peak_idx + W >= len(slot):
-        continue
-    window = slot[peak_idx - W : peak_idx + W + 1]
-    stacked.append(window)
-
-stacked = np.array(stacked)
-print(f"Number of slots/windows stacked: {len(stacked)}")
-
-if stacked.shape[0] == 0:
-    print("No valid slots/windows found for stacking. Try reducing W or check your data.")
-    sys.exit(1)
-
-# Store the gap between the last value before the peak and the peak value for each slot
-gaps = []
-for i, slot in enumerate(slots):
-    peak_idx = np.argmax(slot)
-    if peak_idx - W < 0 or peak_idx + W >= len(slot):
-        continue
-    before_peak_idx = peak_idx - 1
-    if before_peak_idx < 0:
-        continue
-    gap = slot[peak_idx] - slot[before_peak_idx]
-    if gap < 20: # Ignore gaps that are too small
-        continue
-    gaps.append(gap)
-
-mean_stacked = np.mean(stacked, axis=0)
-std_stacked = np.std(stacked, axis=0)
-max_stacked = np.max(stacked, axis=0)
-min_stacked = np.min(stacked, axis=0)
-center_time = (np.arange(-W, W+1)) * np.median(np.diff(t))
-
-# Ensure lengths match before plotting
-if len(center_time) != len(mean_stacked):
-    print(f"Shape mismatch: center_time ({len(center_time)}), mean_stacked ({len(mean_stacked)})")
-    sys.exit(1)
-
-# Prepare directory for saving figures and stats
-stats_dir = os.path.join(input_folder, f"exp_{exp_number}")
-os.makedirs(stats_dir, exist_ok=True)
-
-# Plot and save stacked slot figure
-plt.figure(figsize=(10, 5))
-plt.plot(center_time, mean_stacked, linestyle='-', marker='o', markersize=1, color='C0', label='Mean')
-plt.fill_between(center_time, mean_stacked - std_stacked, mean_stacked + std_stacked, color='C0', alpha=0.2, label='±1 std')
-plt.plot(center_time, max_stacked, color='C3', alpha=0.2, label='max')
-plt.plot(center_time, min_stacked, color='green', alpha=0.2, label='min')
-plt.xlabel('Time relative reconf. peak (s)', fontsize=12)
-plt.ylabel('Uplink latency (ms)', fontsize=12)
-plt.title('Stacked Slots (centered on reconfiguration)', fontsize=14)
-plt.legend(fontsize=11)
-plt.grid(True, which='both', linestyle=':', linewidth=0.7, alpha=0.7)
-plt.tight_layout()
-stacked_fig_path = os.path.join(stats_dir, f"stacked_slots_series_{series_number}.png")
-plt.savefig(stacked_fig_path)
-plt.show()
-
-# Statistics on the gaps
-if gaps:
-    gaps = np.array(gaps)
-    gap_stats = {
-        "mean": float(np.mean(gaps)),
-        "std": float(np.std(gaps)),
-        "min": float(np.min(gaps)),
-        "max": float(np.max(gaps)),
-        "count": int(len(gaps))
+DEFAULT_PERIOD = 15  # seconds, used when no period can be detected
+
+def autocorrelation(signal, max_lag=None):
+    # Normalised autocorrelation of the demeaned signal for lags 0..max_lag, through a
+    # zero-padded FFT (Wiener-Khinchin): O(n log n) instead of O(n^2) for np.correlate
+    n = len(signal)
+    max_lag = n - 1 if max_lag is None else min(max_lag, n - 1)
+    demeaned = signal - np.mean(signal)
+    size = next_fast_len(n + max_lag + 1)  # enough padding that lags up to max_lag do not wrap
+    spectrum = rfft(demeaned, size)
+    acf = irfft(spectrum * np.conj(spectrum), size)[:max_lag + 1]
+    return acf / acf[0] if acf[0] > 0 else acf
+
+def resample(t, signal, dt):
+    # Lost packets leave gaps; interpolate onto a regular grid so that lag k means k * dt seconds
+    grid = np.arange(t[0], t[-1], dt)
+    return grid, np.interp(grid, t, signal)
+
+def estimate_period(t, signal, max_lag_s=60.0, min_period_s=1.0):
+    # Period (s) from the autocorrelation peaks, or None when there is no clear periodicity.
+    # Harmonics at 2x, 3x the period are about as high as the first peak, so the earliest
+    # peak reaching 80% of the highest one is taken and refined by parabolic interpolation
+    dt = np.median(np.diff(t))
+    _, regular = resample(t, signal, dt)
+    acf = autocorrelation(regular, int(max_lag_s / dt))
+    min_lag = max(1, int(min_period_s / dt))
+    peaks, props = find_peaks(acf[min_lag:], height=0.1, prominence=0.05)
+    if len(peaks) == 0:
+        return None, acf, dt
+    heights = props["peak_heights"]
+    lag = min_lag + peaks[np.argmax(heights >= 0.8 * heights.max())]
+    if 0 < lag < len(acf) - 1:
+        y0, y1, y2 = acf[lag - 1], acf[lag], acf[lag + 1]
+        denominator = y0 - 2 * y1 + y2
+        offset = 0.5 * (y0 - y2) / denominator if denominator else 0.0
+    else:
+        offset = 0.0
+    return (lag + offset) * dt, acf, dt
+
+def choose_period(t, signal, period=None, max_lag_s=60.0):
+    detected_period, _, _ = estimate_period(t, signal, max_lag_s)
+    if detected_period is not None:
+        print(f"Estimated period: {detected_period:.2f} seconds")
+    else:
+        print(f"No period found within {max_lag_s:g} s of lag")
+
+    if period is not None:
+        print(f"Using period: {period:.2f} seconds (--period)")
+        return period
+    if detected_period is not None:
+        return detected_period
+    print(f"Using fallback period: {DEFAULT_PERIOD:.2f} seconds")
+    return DEFAULT_PERIOD
+
+def stack_slots(signal, slot_length, W=150, min_gap=20):
+    # One pass over an (n_slots, slot_length) view of the signal: the peak of every slot, the
+    # 2W+1 samples centred on it (slots where that window would cross the slot edge are
+    # dropped), and the jump from the sample before the peak to the peak (gaps < min_gap ms dropped)
+    n_slots = len(signal) // slot_length
+    slots = signal[:n_slots * slot_length].reshape(n_slots, slot_length)
+    peaks = np.argmax(slots, axis=1)
+    rows = np.nonzero((peaks - W >= 0) & (peaks + W < slot_length))[0]
+    centers = peaks[rows]
+    stacked = slots[rows[:, None], centers[:, None] + np.arange(-W, W + 1)]
+
+    has_before = centers >= 1
+    rows, centers = rows[has_before], centers[has_before]
+    gaps = slots[rows, centers] - slots[rows, centers - 1]
+    return n_slots, stacked, gaps[gaps >= min_gap]
+
+def stack_runs(runs, period=None, max_lag_s=60.0, W=150):
+    # runs: [(label, t [s], signal)]. Every run is slotted by its own period (or the override)
+    # and all windows and gaps are pooled, so a whole campaign is stacked in one pass
+    all_stacked, all_gaps = [], []
+    for label, t, signal in runs:
+        print(f"--- {label} ---")
+        run_period = choose_period(t, signal, period, max_lag_s)
+        slot_length = int(round(run_period / np.median(np.diff(t))))
+        n_slots, stacked, gaps = stack_slots(signal, slot_length, W)
+        print(f"Slot length in samples: {slot_length}, slots: {n_slots}, windows stacked: {len(stacked)}")
+        all_stacked.append(stacked)
+        all_gaps.append(gaps)
+    return np.concatenate(all_stacked), np.concatenate(all_gaps)
+
+def stacked_stats(stacked):
+    return {
+        "mean": np.mean(stacked, axis=0),
+        "std": np.std(stacked, axis=0),
+        "max": np.max(stacked, axis=0),
+        "min": np.min(stacked, axis=0),
     }
-    
-    print(f"Gap statistics (peak - last before peak):")
-    print(f"  Mean: {gap_stats['mean']:.4f}")
-    print(f"  Std:  {gap_stats['std']:.4f}")
-    print(f"  Min:  {gap_stats['min']:.4f}")
-    print(f"  Max:  {gap_stats['max']:.4f}")
-
-    # Save statistics as JSON
-    stats_path = os.path.join(stats_dir, f"gap_stats_series_{series_number}.json")
-    with open(stats_path, "w") as f:
-        json.dump(gap_stats, f, indent=4)
-
-    # Plot and save histogram of gaps
-    plt.figure(figsize=(7,4))
-    plt.hist(gaps, bins=20, color='C2', alpha=0.75)
-    plt.xlabel('Gap (peak - last before peak) [ms]')
-    plt.ylabel('Count')
-    plt.title('Distribution of Gap Values (Peak - Last Before Peak)')
-    plt.grid(True, linestyle=':', alpha=0.6)
-    plt.tight_layout()
-    hist_fig_path = os.path.join(stats_dir, f"gap_hist_series_{series_number}.png")
-    plt.savefig(hist_fig_path)
-    plt.show()
 
-else:
-    print("No valid gaps found for statistics or plotting.")
\ No newline at end of file
+def load_run(exp_number, series_number):
+    if series_number == "all":
+        data = loader.load_experiment(exp_number)
+    else:
+        data = loader.load_processed(exp_number, series_number)
+    t = data["sent_at"] / 1000.0  # convert ms to seconds
+    return f"exp_{exp_number} series {series_number}", t, data["sender_to_receiver"]
+
+def render(runs, stats_dir, series_number, period=None, max_lag_s=60.0, W=150, show=True):
+    # Stacked slot figure, gap statistics and gap histogram of the runs, saved into stats_dir.
+    # Returns the written paths, or None when no slot could be stacked.
+    # W: points before and after the peak (window size = 2*W+1)
+
+    # --- Slotting and stacking windows centered on the peak of each slot ---
+    stacked, gaps = stack_runs(runs, period, max_lag_s, W)
+    print(f"Number of slots/windows stacked: {len(stacked)}")
+
+    if stacked.shape[0] == 0:
+        print("No valid slots/windows found for stacking. Try reducing W or check your data.")
+        return None
+
+    stats = stacked_stats(stacked)
+    mean_stacked, std_stacked = stats["mean"], stats["std"]
+    max_stacked, min_stacked = stats["max"], stats["min"]
+    center_time = (np.arange(-W, W+1)) * np.median(np.diff(runs[0][1]))
+
+    # Prepare directory for saving figures and stats
+    os.makedirs(stats_dir, exist_ok=True)
+    fig_paths = []
+
+    # Plot and save stacked slot figure
+    plt.figure(figsize=(10, 5))
+    plt.plot(center_time, mean_stacked, linestyle='-', marker='o', markersize=1, color='C0', label='Mean')
+    plt.fill_between(center_time, mean_stacked - std_stacked, mean_stacked + std_stacked, color='C0', alpha=0.2, label='±1 std')
+    plt.plot(center_time, max_stacked, color='C3', alpha=0.2, label='max')
+    plt.plot(center_time, min_stacked, color='green', alpha=0.2, label='min')
+    plt.xlabel('Time relative reconf. peak (s)', fontsize=12)
+    plt.ylabel('Uplink latency (ms)', fontsize=12)
+    plt.title('Stacked Slots (centered on reconfiguration)', fontsize=14)
+    plt.legend(fontsize=11)
+    plt.grid(True, which='both', linestyle=':', linewidth=0.7, alpha=0.7)
+    plt.tight_layout()
+    stacked_fig_path = os.path.join(stats_dir, f"stacked_slots_series_{series_number}.png")
+    plt.savefig(stacked_fig_path)
+    fig_paths.append(stacked_fig_path)
+    if show:
+        plt.show()
+    plt.close()
+
+    # Statistics on the gaps
+    if len(gaps):
+        gap_stats = {
+            "mean": float(np.mean(gaps)),
+            "std": float(np.std(gaps)),
+            "min": float(np.min(gaps)),
+            "max": float(np.max(gaps)),
+            "count": int(len(gaps))
+        }
+    
+        print(f"Gap statistics (peak - last before peak):")
+        print(f"  Mean: {gap_stats['mean']:.4f}")
+        print(f"  Std:  {gap_stats['std']:.4f}")
+        print(f"  Min:  {gap_stats['min']:.4f}")
+        print(f"  Max:  {gap_stats['max']:.4f}")
+
+        # Save statistics as JSON
+        stats_path = os.path.join(stats_dir, f"gap_stats_series_{series_number}.json")
+        with open(stats_path, "w") as f:
+            json.dump(gap_stats, f, indent=4)
+        fig_paths.append(stats_path)
+
+        # Plot and save histogram of gaps
+        plt.figure(figsize=(7,4))
+        plt.hist(gaps, bins=20, color='C2', alpha=0.75)
+        plt.xlabel('Gap (peak - last before peak) [ms]')
+        plt.ylabel('Count')
+        plt.title('Distribution of Gap Values (Peak - Last Before Peak)')
+        plt.grid(True, linestyle=':', alpha=0.6)
+        plt.tight_layout()
+        hist_fig_path = os.path.join(stats_dir, f"gap_hist_series_{series_number}.png")
+        plt.savefig(hist_fig_path)
+        fig_paths.append(hist_fig_path)
+        if show:
+            plt.show()
+        plt.close()
+
+    else:
+        print("No valid gaps found for statistics or plotting.")
+    return fig_paths
+
+def main():
+    parser = argparse.ArgumentParser(description="Stack periodic latency peaks of a series")
+    parser.add_argument('exp_number', nargs='?', help='Experiment number')
+    parser.add_argument('series_number', nargs='?',
+                        help='Series number, or "all" for the whole experiment (default 1)')
+    parser.add_argument('--runs', nargs='+', metavar='EXP[:SERIES]',
+                        help='Stack several experiments (whole) or series together, e.g. 3 4 5:2')
+    parser.add_argument('--name', default='campaign',
+                        help='Output name suffix for --runs results, written to results_client/')
+    parser.add_argument('--period', type=float, help='Slot period in seconds instead of the estimated one')
+    parser.add_argument('--max-lag', type=float, default=60.0,
+                        help='Longest autocorrelation lag searched for the period (s)')
+    args = parser.parse_args()
+
+    # --- Argument parsing for experiment and series number ---
+    if args.runs:
+        runs = [load_run(*(run.split(':', 1) if ':' in run else (run, "all"))) for run in args.runs]
+        stats_dir = input_folder
+        series_number = args.name
+    else:
+        series_number = "1"
+        if args.exp_number is not None:
+            exp_number = args.exp_number
+            series_number = args.series_number or series_number
+        else:
+            exp_number = input("Enter experiment number: ").strip()
+            series_number = input("Enter series number: ").strip()
+        runs = [load_run(exp_number, series_number)]
+        stats_dir = os.path.join(input_folder, f"exp_{exp_number}")
+
+    if render(runs, stats_dir, series_number, args.period, args.max_lag) is None:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,36 +1,14 @@
 import numpy as np
-import matplotlib.pyplot as plt
-import pandas as pd
 import os
-import sys
+import re
+import glob
+import argparse
+import pandas as pd
 from scipy.signal import find_peaks
-import seaborn as sns
+import loader
 
-# --- Argument parsing for experiment number ---
 input_folder = "results_client"
 
-series_number = "1"
-if len(sys.argv) == 2:
-    exp_number = sys.argv[1]
-elif len(sys.argv) == 3:
-    exp_number = sys.argv[1]
-    series_number = sys.argv[2]
-else:
-    exp_number = input("Enter experiment number: ").strip()
-    series_number = input("Enter series number: ").strip()
-
-filename = "series_" + series_number + "_processed.csv"
-processed_file_path = os.path.join(input_folder, "exp_" + exp_number, filename)
-
-# --- Load data ---
-df = pd.read_csv(processed_file_path)
-t = df["sent_at"].values / 1000.0  # convert ms to seconds
-signal = df["sender_to_receiver"].values
-
-# --- Event detection: find peaks in the signal ---
-peaks, _ = find_peaks(signal, height=np.mean(signal) + 6 * np.std(signal), distance=1000)
-event_indices = peaks
-
 # --- Parameters: N points before, M points after each event ---
 N = 500  # Number of points before peak
 M = 500  # Number of points after peak
@@ -38,68 +16,166 @@ M = 500  # Number of points after peak
 N_offset = 10  # How much before the peak to start the averaging window
 M_offset = 10  # How after the peak to start the averaging window
 
-M = M + M_offset
-N = N + N_offset
-
-means_before = []
-means_after = []
-peak_minus_before = []
-peak_minus_after = []
-peak_values = []
-
-for idx in event_indices:
-    if idx - N < 0:
-        continue
-    before = signal[idx - N:idx - N_offset]
-    after = signal[idx + M_offset:min(idx + M, len(signal))]
-    if len(after) < M - M_offset:
-        continue
-    peak_val = signal[idx]
-    mean_before = np.mean(before)
-    mean_after = np.mean(after)
-    means_before.append(mean_before)
-    means_after.append(mean_after)
-    peak_values.append(peak_val)
-    peak_minus_before.append(peak_val - mean_before)
-    peak_minus_after.append(peak_val - mean_after)
-
-# --- Plotting ---
-plt.figure(figsize=(12,6))
-plt.plot(t, signal, label='sender_to_receiver', marker='.', markersize=4, linewidth=1)
-for idx in event_indices:
-    if idx-N < 0 or idx+M > len(signal):
-        continue
-    plt.axvspan(t[idx-N], t[idx - N_offset], color='green', alpha=0.1)
-    plt.axvspan(t[idx + M_offset], t[min(idx + M, len(t)-1)], color='blue', alpha=0.1)
-plt.scatter(t[event_indices], signal[event_indices], color='red', label='Detected Events (Peaks)', s=20)
-plt.xlabel('sent_at (s)')
-plt.ylabel('sender_to_receiver')
-plt.legend()
-plt.title('Signal with Detected Events and Analysis Windows')
-plt.show()
-
-# --- Plot histograms (binned distributions) with publication-quality style ---
-
-sns.set_context("paper")
-sns.set_style("whitegrid")
-
-plt.figure(figsize=(8, 4))
-bins = np.linspace(
-    min(min(peak_minus_before), min(peak_minus_after)),
-    max(max(peak_minus_before), max(peak_minus_after)),
-    20
-)
-sns.histplot(peak_minus_before, bins=bins, color='C0', alpha=0.7, label='Peak - Mean (Before)', kde=True, stat="count")
-sns.histplot(peak_minus_after, bins=bins, color='C1', alpha=0.7, label='Peak - Mean (After)', kde=True, stat="count")
-
-plt.xlabel('Latency Difference (ms)', fontsize=12)
-plt.ylabel('Count', fontsize=12)
-plt.legend(fontsize=11, frameon=True)
-plt.title('Distribution of Latency Change Around Events', fontsize=13)
-plt.tight_layout()
-sns.despine()
-plt.show()
-
-# --- Print statistics ---
-print(f"Peak - Mean(Before): mean={np.mean(peak_minus_before):.4f}, std={np.std(peak_minus_before):.4f}")
-print(f"Peak - Mean(After):  mean={np.mean(peak_minus_after):.4f}, std={np.std(peak_minus_after):.4f}")
\ No newline at end of file
+EVENT_COLUMNS = ('index', 'peak', 'mean_before', 'mean_after', 'peak_minus_before', 'peak_minus_after')
+
+def detect_events(signal, sigma=6, distance=1000):
+    # --- Event detection: find peaks in the signal ---
+    peaks, _ = find_peaks(signal, height=np.mean(signal) + sigma * np.std(signal), distance=distance)
+    return peaks
+
+def event_window_means(signal, event_indices, n=N, m=M, n_offset=N_offset, m_offset=M_offset):
+    # Mean of [idx - n - n_offset, idx - n_offset) and [idx + m_offset, idx + m + m_offset) for every
+    # event at once, from one cumulative sum. Events whose windows run off either end are dropped
+    n = n + n_offset
+    m = m + m_offset
+    event_indices = np.asarray(event_indices, dtype=np.int64)
+    idx = event_indices[(event_indices - n >= 0) & (event_indices + m <= len(signal))]
+
+    csum = np.concatenate(([0.0], np.cumsum(signal, dtype=np.float64)))
+    mean_before = (csum[idx - n_offset] - csum[idx - n]) / (n - n_offset)
+    mean_after = (csum[idx + m] - csum[idx + m_offset]) / (m - m_offset)
+    peak = signal[idx]
+    return {
+        "index": idx,
+        "peak": peak,
+        "mean_before": mean_before,
+        "mean_after": mean_after,
+        "peak_minus_before": peak - mean_before,
+        "peak_minus_after": peak - mean_after,
+    }
+
+def analyze_series(exp_number, series_number):
+    data = loader.load_processed(exp_number, series_number)
+    t = data["sent_at"] / 1000.0  # convert ms to seconds
+    signal = data["sender_to_receiver"]
+    event_indices = detect_events(signal)
+    return t, signal, event_indices, event_window_means(signal, event_indices)
+
+def plot_events(t, signal, event_indices, events, stats_dir, series_number, show=True):
+    # Signal with the analysis windows and the histogram of peak - mean, saved into stats_dir
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    n = N + N_offset
+    m = M + M_offset
+
+    # --- Plotting ---
+    plt.figure(figsize=(12,6))
+    plt.plot(t, signal, label='sender_to_receiver', marker='.', markersize=4, linewidth=1)
+    for idx in event_indices:
+        if idx-n < 0 or idx+m > len(signal):
+            continue
+        plt.axvspan(t[idx-n], t[idx - N_offset], color='green', alpha=0.1)
+        plt.axvspan(t[idx + M_offset], t[min(idx + m, len(t)-1)], color='blue', alpha=0.1)
+    plt.scatter(t[event_indices], signal[event_indices], color='red', label='Detected Events (Peaks)', s=20)
+    plt.xlabel('sent_at (s)')
+    plt.ylabel('sender_to_receiver')
+    plt.legend()
+    plt.title('Signal with Detected Events and Analysis Windows')
+    os.makedirs(stats_dir, exist_ok=True)
+    fig_paths = [os.path.join(stats_dir, f"events_series_{series_number}.png"),
+                 os.path.join(stats_dir, f"event_hist_series_{series_number}.png")]
+    plt.savefig(fig_paths[0])
+    if show:
+        plt.show()
+    plt.close()
+    if not len(events["peak"]):
+        return fig_paths[:1]
+
+    # --- Plot histograms (binned distributions) with publication-quality style ---
+    peak_minus_before = events["peak_minus_before"]
+    peak_minus_after = events["peak_minus_after"]
+
+    sns.set_context("paper")
+    sns.set_style("whitegrid")
+
+    plt.figure(figsize=(8, 4))
+    bins = np.linspace(
+        min(min(peak_minus_before), min(peak_minus_after)),
+        max(max(peak_minus_before), max(peak_minus_after)),
+        20
+    )
+    sns.histplot(peak_minus_before, bins=bins, color='C0', alpha=0.7, label='Peak - Mean (Before)', kde=True, stat="count")
+    sns.histplot(peak_minus_after, bins=bins, color='C1', alpha=0.7, label='Peak - Mean (After)', kde=True, stat="count")
+
+    plt.xlabel('Latency Difference (ms)', fontsize=12)
+    plt.ylabel('Count', fontsize=12)
+    plt.legend(fontsize=11, frameon=True)
+    plt.title('Distribution of Latency Change Around Events', fontsize=13)
+    plt.tight_layout()
+    sns.despine()
+    plt.savefig(fig_paths[1])
+    if show:
+        plt.show()
+    plt.close()
+    return fig_paths
+
+def render(exp_number, series_number, show=True):
+    t, signal, event_indices, events = analyze_series(exp_number, series_number)
+    fig_paths = plot_events(t, signal, event_indices, events,
+                            os.path.join(input_folder, f"exp_{exp_number}"), series_number, show)
+    print_stats(events)
+    return fig_paths
+
+def print_stats(events):
+    # --- Print statistics ---
+    peak_minus_before = events["peak_minus_before"]
+    peak_minus_after = events["peak_minus_after"]
+    if not len(peak_minus_before):
+        print("No events detected")
+        return
+    print(f"Peak - Mean(Before): mean={np.mean(peak_minus_before):.4f}, std={np.std(peak_minus_before):.4f}")
+    print(f"Peak - Mean(After):  mean={np.mean(peak_minus_after):.4f}, std={np.std(peak_minus_after):.4f}")
+
+def processed_series(exp_number):
+    paths = glob.glob(os.path.join(input_folder, f"exp_{exp_number}", "series_*_processed.csv"))
+    return sorted(int(re.search(r'series_(\d+)_processed\.csv$', path).group(1)) for path in paths)
+
+def batch(exp_numbers, output):
+    # Headless: every processed series of every experiment, one row per event in a single table
+    tables = []
+    for exp_number in exp_numbers:
+        for series_number in processed_series(exp_number):
+            t, _, _, events = analyze_series(exp_number, series_number)
+            table = pd.DataFrame(events, columns=EVENT_COLUMNS)
+            table.insert(0, "sent_at", t[events["index"]])
+            table.insert(0, "series", series_number)
+            table.insert(0, "exp", exp_number)
+            tables.append(table)
+            print(f"exp_{exp_number} series {series_number}: {len(table)} events")
+
+    if not tables:
+        print("No processed series found")
+        return
+    events = pd.concat(tables, ignore_index=True)
+    events.to_csv(output, index=False)
+    print_stats(events)
+    print(f"{len(events)} events written to {output}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Latency before and after detected events")
+    parser.add_argument('exp_number', nargs='?', help='Experiment number')
+    parser.add_argument('series_number', nargs='?', help='Series number (default 1)')
+    parser.add_argument('--batch', nargs='+', metavar='EXP',
+                        help='Headless: analyse every series of these experiments into one table')
+    parser.add_argument('--output', default=os.path.join(input_folder, "events.csv"),
+                        help='Event table written by --batch')
+    args = parser.parse_args()
+
+    if args.batch:
+        batch(args.batch, args.output)
+        return
+
+    # --- Argument parsing for experiment number ---
+    series_number = "1"
+    if args.exp_number is not None:
+        exp_number = args.exp_number
+        series_number = args.series_number or series_number
+    else:
+        exp_number = input("Enter experiment number: ").strip()
+        series_number = input("Enter series number: ").strip()
+
+    render(exp_number, series_number)
+
+if __name__ == "__main__":
+    main()
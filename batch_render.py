@@ -0,0 +1,132 @@
+import io
+import os
+import re
+import sys
+import glob
+import time
+import argparse
+import fnmatch
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+
+input_folder = "results_client"
+
+SCRIPTS = ('plot_ts', 'analyze_ac', 'analyze_pa', 'plot_fft')
+
+def init_worker():
+    # Once per worker process: headless backend, then the heavy imports, so every task after
+    # the first pays neither the interpreter start nor the matplotlib/scipy/seaborn import
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot
+    import seaborn
+    import scipy.signal
+    import plot_ts, analyze_ac, analyze_pa, plot_fft
+
+def outputs(script, exp_dir, series_number):
+    # Files a script writes for one series; the job is up to date when all of them are newer
+    # than its inputs. The gap files of analyze_ac are optional (no gaps, no files)
+    if script == 'plot_ts':
+        return [os.path.join(exp_dir, f"processed_latency_data_{series_number}.png"),
+                os.path.join(exp_dir, f"rtt_{series_number}.png")]
+    if script == 'analyze_ac':
+        return [os.path.join(exp_dir, f"stacked_slots_series_{series_number}.png")]
+    if script == 'analyze_pa':
+        return [os.path.join(exp_dir, f"events_series_{series_number}.png")]
+    return [os.path.join(exp_dir, f"series_{series_number}_fft.png")]
+
+def inputs(script, exp_dir, series_number):
+    # The data file and the script itself, so editing a plot regenerates its figures
+    if script == 'plot_fft':
+        data = os.path.join(exp_dir, f"series_{series_number}.csv")
+    else:
+        data = os.path.join(exp_dir, f"series_{series_number}_processed.csv")
+    return [data, os.path.join(os.path.dirname(os.path.abspath(__file__)), script + ".py")]
+
+def up_to_date(script, exp_dir, series_number):
+    try:
+        newest_input = max(os.path.getmtime(path) for path in inputs(script, exp_dir, series_number))
+        return all(os.path.getmtime(path) >= newest_input for path in outputs(script, exp_dir, series_number))
+    except OSError:
+        return False
+
+def render_series(exp_number, series_number, scripts):
+    # All figures of one series in one task, so its cached arrays are loaded once and no two
+    # workers write the same cache file
+    import plot_ts, analyze_ac, analyze_pa, plot_fft
+    exp_dir = os.path.join(input_folder, f"exp_{exp_number}")
+    start = time.perf_counter()
+    written, errors = [], []
+    for script in scripts:
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):  # per-figure chatter of the scripts
+                if script == 'plot_ts':
+                    paths = plot_ts.render(exp_number, series_number, show=False)
+                elif script == 'analyze_ac':
+                    paths = analyze_ac.render([analyze_ac.load_run(exp_number, series_number)], exp_dir,
+                                              series_number, show=False)
+                elif script == 'analyze_pa':
+                    paths = analyze_pa.render(exp_number, series_number, show=False)
+                else:
+                    paths = plot_fft.render(os.path.join(exp_dir, f"series_{series_number}.csv"), show=False)
+            written.extend(paths or [])
+        except (Exception, SystemExit) as e:
+            errors.append(f"{script}: {e}")
+    return exp_number, series_number, written, errors, time.perf_counter() - start
+
+def find_jobs(experiments, series_pattern, scripts, force=False):
+    # {(exp, series): [scripts]} for every experiment/series matching the globs whose outputs are stale
+    jobs = {}
+    skipped = 0
+    for exp_dir in sorted(glob.glob(os.path.join(input_folder, "exp_*"))):
+        exp_number = os.path.basename(exp_dir)[len("exp_"):]
+        if not any(fnmatch.fnmatch(exp_number, pattern) for pattern in experiments):
+            continue
+        for path in glob.glob(os.path.join(exp_dir, "series_*.csv")):
+            match = re.search(r'series_(\d+)(_processed)?\.csv$', path)
+            if not match or not fnmatch.fnmatch(match.group(1), series_pattern):
+                continue
+            series_number = match.group(1)
+            for script in scripts:
+                if (script == 'plot_fft') == bool(match.group(2)):
+                    continue  # plot_fft reads the raw series, the others the processed one
+                if not force and up_to_date(script, exp_dir, series_number):
+                    skipped += 1
+                    continue
+                jobs.setdefault((exp_number, series_number), []).append(script)
+    return jobs, skipped
+
+def series_key(job):
+    exp_number, series_number = job
+    return (int(exp_number) if exp_number.isdigit() else exp_number, int(series_number))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render the figures of many experiments and series in parallel")
+    parser.add_argument('experiments', nargs='*', default=['*'],
+                        help='Experiment number globs, e.g. 3 "1*" (default: all)')
+    parser.add_argument('--series', default='*', help='Series number glob (default: all)')
+    parser.add_argument('--scripts', nargs='+', choices=SCRIPTS, default=list(SCRIPTS),
+                        help='Scripts to render (default: all)')
+    parser.add_argument('--workers', type=int, help='Worker processes (default: CPU count)')
+    parser.add_argument('--force', action='store_true', help='Render even when the outputs are up to date')
+    args = parser.parse_args()
+
+    jobs, skipped = find_jobs(args.experiments, args.series, args.scripts, args.force)
+    print(f"{sum(len(scripts) for scripts in jobs.values())} figures to render in {len(jobs)} series, "
+          f"{skipped} up to date")
+    if not jobs:
+        sys.exit(0)
+
+    start = time.perf_counter()
+    failed = 0
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker) as executor:
+        futures = [executor.submit(render_series, exp_number, series_number, jobs[(exp_number, series_number)])
+                   for exp_number, series_number in sorted(jobs, key=series_key)]
+        for future in futures:
+            exp_number, series_number, written, errors, elapsed = future.result()
+            print(f"exp_{exp_number} series {series_number}: {len(written)} files in {elapsed:.1f} s")
+            for error in errors:
+                print(f"  failed {error}")
+            failed += len(errors)
+    print(f"Done in {time.perf_counter() - start:.1f} s, {failed} failed")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,80 @@
+import os
+import glob
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+from benchmarks.common import write_results, python_command
+from benchmarks.synthetic import generate
+
+# Times every analysis stage on synthetic experiments of increasing size. Each stage is its
+# own process, run headless (Agg backend) in a scratch directory; its wall time and peak
+# resident memory come from wait4(), so stages do not share caches or memory. Later stages
+# find the .npz cache written by earlier ones, as they would after process.py in practice.
+
+def stage_commands(exp_number, exp_dir):
+    # (name, argv) in pipeline order; process.py must run first, the others read its output
+    raw_series = sorted(glob.glob(os.path.join(exp_dir, "series_*.csv")))
+    raw_series = [path for path in raw_series if not path.endswith('_processed.csv')]
+    return [
+        ('process', python_command('process.py', '--all', exp_number)),
+        ('plot_ts', python_command('plot_ts.py', exp_number, 1, '--no-show')),
+        ('analyze_ac', python_command('analyze_ac.py', exp_number, 'all')),
+        ('analyze_pa', python_command('analyze_pa.py', '--batch', exp_number, '--output', 'events.csv')),
+        ('plot_fft_welch', python_command('plot_fft.py', '--welch', *raw_series)),
+        ('aggregate', python_command('aggregate.py', exp_number, '--output', 'summary.csv')),
+    ]
+
+def run_stage(argv, workdir):
+    # Wall time (s), peak RSS (MiB) and exit status of one stage
+    env = dict(os.environ, MPLBACKEND='Agg')
+    with open(os.path.join(workdir, "stages.log"), 'a') as log:
+        log.write(f"$ {' '.join(argv)}\n")
+        log.flush()
+        start = time.perf_counter()
+        proc = subprocess.Popen(argv, cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT)
+        _, status, usage = os.wait4(proc.pid, 0)
+        elapsed = time.perf_counter() - start
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    return elapsed, usage.ru_maxrss / 1024, proc.returncode  # ru_maxrss is in KiB on Linux
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time and peak memory of the analysis scripts on synthetic traces")
+    parser.add_argument('--packets', type=int, nargs='+', default=[100_000, 1_000_000, 3_600_000],
+                        help='Trace sizes to benchmark')
+    parser.add_argument('--stages', nargs='+',
+                        choices=['process', 'plot_ts', 'analyze_ac', 'analyze_pa', 'plot_fft_welch', 'aggregate'],
+                        help='Stages to time (default: all; process always runs)')
+    parser.add_argument('--max-lines', type=int, default=120000, help='Lines per series file')
+    parser.add_argument('--seed', type=int, default=1, help='Random seed of the traces')
+    parser.add_argument('--workdir', help='Keep the traces and outputs here instead of a temporary directory')
+    parser.add_argument('--output', help='Results file (default benchmarks/results/analysis_<time>.json)')
+    args = parser.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="bench_analysis_")
+    os.makedirs(workdir, exist_ok=True)
+    results = []
+    try:
+        for packets in args.packets:
+            start = time.perf_counter()
+            exp_number, counts = generate(root=workdir, packets=packets, max_lines=args.max_lines, seed=args.seed)
+            generation_s = time.perf_counter() - start
+            exp_dir = os.path.join(workdir, 'results_client', f'exp_{exp_number}')
+            print(f"{packets} packets (exp_{exp_number}, generated in {generation_s:.1f} s)")
+
+            stages = {}
+            for name, argv in stage_commands(str(exp_number), exp_dir):
+                if args.stages and name not in args.stages and name != 'process':
+                    continue
+                elapsed, peak_mib, returncode = run_stage(argv, workdir)
+                stages[name] = {"seconds": elapsed, "peak_rss_mib": peak_mib, "returncode": returncode}
+                status = "" if returncode == 0 else f" (exit {returncode}, see {workdir}/stages.log)"
+                print(f"  {name:15s} {elapsed:8.2f} s {peak_mib:8.0f} MiB{status}")
+            results.append({"packets": packets, "received": counts["received"], "generation_s": generation_s,
+                            "stages": stages})
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    write_results("analysis", results, args.output)
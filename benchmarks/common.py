@@ -0,0 +1,60 @@
+import os
+import sys
+import json
+import time
+import platform
+import subprocess
+from datetime import datetime
+
+import numpy as np
+
+# Shared by the benchmark scripts: run metadata, distribution summaries and JSON output
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(REPO, "benchmarks", "results")
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def metadata():
+    # Enough context to tell two result files apart when comparing runs over time
+    return {
+        "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+def distribution(values, scale=1.0):
+    # Mean / p50 / p90 / p99 / p99.9 / max of a sample, divided by scale (e.g. 1e3 for ns -> us)
+    values = np.asarray(values, dtype=np.float64) / scale
+    if not len(values):
+        return {}
+    p50, p90, p99, p999 = np.percentile(values, [50, 90, 99, 99.9])
+    return {
+        "count": int(len(values)),
+        "mean": float(values.mean()),
+        "p50": float(p50),
+        "p90": float(p90),
+        "p99": float(p99),
+        "p99.9": float(p999),
+        "max": float(values.max()),
+    }
+
+def write_results(name, results, output=None):
+    # benchmarks/results/<name>_<timestamp>.json unless an output path is given
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{name}_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    with open(output, 'w') as f:
+        json.dump({"benchmark": name, **metadata(), "results": results}, f, indent=4)
+    print(f"Results written to {output}")
+    return output
+
+def python_command(script, *args):
+    # Unbuffered, so log files can be polled while the process runs
+    return [sys.executable, '-u', os.path.join(REPO, script), *map(str, args)]
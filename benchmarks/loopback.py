@@ -0,0 +1,229 @@
+import os
+import glob
+import json
+import time
+import signal
+import socket
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.common import distribution, write_results, python_command
+from loader import parse_csv
+from rotating_writer import RotatingWriter, FSYNC_POLICIES
+
+# Server and client run as subprocesses on ::1, each run in a fresh temporary directory so the
+# results_server/ and results_client/ trees of the repo are left alone. On loopback both ends
+# share one clock, so t_client_recv - t_server_recv is the server's stamp-to-echo path plus
+# the loopback hop, with no clock offset in it.
+
+def free_port():
+    with socket.socket(socket.AF_INET6, socket.SOCK_DGRAM) as sock:
+        sock.bind(('::1', 0))
+        return sock.getsockname()[1]
+
+def start_server(workdir, port, engine='loop', packet_format='text', kernel_timestamps=False, mmsg_batch=0):
+    args = ['--host', '::1', '--port', port, '--engine', engine, '--packet-format', packet_format, '--timeout', 600]
+    if kernel_timestamps:
+        args.append('--kernel-timestamps')
+    if mmsg_batch > 1:
+        args += ['--mmsg-batch', mmsg_batch]
+    log_path = os.path.join(workdir, "server.log")
+    with open(log_path, 'w') as log:
+        proc = subprocess.Popen(python_command('server.py', *args), cwd=workdir, stdout=log, stderr=subprocess.STDOUT)
+    deadline = time.monotonic() + 15
+    while time.monotonic() < deadline:
+        with open(log_path, 'r') as f:
+            if 'listening' in f.read():
+                return proc
+        if proc.poll() is not None:
+            break
+        time.sleep(0.05)
+    stop_server(proc)
+    raise RuntimeError(f"Server did not start, see {log_path}")
+
+def stop_server(proc):
+    # SIGINT takes the KeyboardInterrupt path, which flushes everything still queued
+    if proc.poll() is None:
+        proc.send_signal(signal.SIGINT)
+        try:
+            proc.wait(30)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+
+def run_client(workdir, port, total_packets, send_interval=1, burst=1, packet_format='text',
+               kernel_timestamps=False, response_timeout=1):
+    args = ['--server-host', '::1', '--server-port', port, '--send-interval', send_interval,
+            '--total-packets', total_packets, '--response-timeout', response_timeout,
+            '--packet-format', packet_format, '--stats-interval', 0, '--burst', burst]
+    if kernel_timestamps:
+        args.append('--kernel-timestamps')
+    with open(os.path.join(workdir, "client.log"), 'w') as log:
+        subprocess.run(python_command('client.py', *args), cwd=workdir, stdout=log,
+                       stderr=subprocess.STDOUT, check=True)
+    return os.path.join(workdir, "results_client", "exp_1")
+
+def echo_run(server_args, client_args):
+    # One server/client pair in a scratch directory. Returns the client's config (inflight
+    # counters), its concatenated series, its send lateness and the server's packet log
+    workdir = tempfile.mkdtemp(prefix="bench_")
+    try:
+        port = free_port()
+        server = start_server(workdir, port, **server_args)
+        try:
+            exp_dir = run_client(workdir, port, **client_args)
+        finally:
+            stop_server(server)
+        with open(os.path.join(exp_dir, "client_config.json"), 'r') as f:
+            config = json.load(f)
+        parts = [parse_csv(path) for path in sorted(glob.glob(os.path.join(exp_dir, "series_*.csv")))]
+        series = {name: np.concatenate([part[name] for part in parts]) for name in parts[0]} if parts else {}
+        lateness = np.load(os.path.join(exp_dir, "send_lateness.npy"))
+        server_paths = sorted(glob.glob(os.path.join(workdir, "results_server", "exp_1", "packets_*.psv")))
+        server_log = pd.concat([pd.read_csv(path, sep='|', header=None, dtype=str) for path in server_paths],
+                               ignore_index=True) if server_paths else None
+        return config, series, lateness, server_log
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def span_rate(timestamps_ns):
+    # Packets per second over the span of a set of timestamps
+    if len(timestamps_ns) < 2:
+        return None
+    span = (int(timestamps_ns.max()) - int(timestamps_ns.min())) / 1e9
+    return (len(timestamps_ns) - 1) / span if span > 0 else None
+
+def bench_echo_rate(rates, duration, engine='loop', mmsg_batch=0, max_loss=0.1):
+    # Offered rate sweep: 1 ms send interval with rate/1000 packets per interval (packet trains).
+    # The highest offered rate still answered with at most max_loss % loss is the sustained rate
+    steps = []
+    sustained = None
+    for rate in rates:
+        burst = max(1, int(round(rate / 1000)))
+        config, series, _, _ = echo_run(
+            {"engine": engine, "mmsg_batch": mmsg_batch},
+            {"total_packets": int(rate * duration), "send_interval": 1, "burst": burst})
+        inflight = config["inflight"]
+        loss_pct = 100 * inflight["lost"] / inflight["sent"] if inflight["sent"] else None
+        step = {
+            "offered_pps": rate,
+            "burst": burst,
+            "sent": inflight["sent"],
+            "received": inflight["received"],
+            "loss_pct": loss_pct,
+            "send_pps": span_rate(series.get("t_client_send", np.empty(0))),
+            "echo_pps": span_rate(series.get("t_client_recv", np.empty(0))),
+        }
+        steps.append(step)
+        print(f"  {rate} pps offered: {step['echo_pps'] or 0:.0f} pps echoed, loss {loss_pct or 0:.3f}%")
+        if loss_pct is None or loss_pct > max_loss:
+            break
+        sustained = rate
+    return {"engine": engine, "mmsg_batch": mmsg_batch, "max_loss_pct": max_loss,
+            "max_sustained_pps": sustained, "steps": steps}
+
+def bench_overhead(engines, rate, duration, packet_format='text'):
+    # Stamp-to-echo (t_client_recv - t_server_recv) with kernel receive timestamps on both ends,
+    # and the server's kernel-to-userspace wakeup delay from the trailing userspace time
+    results = {}
+    for engine in engines:
+        kernel = engine != 'asyncio'  # the asyncio engine has no recvmsg
+        config, series, _, server_log = echo_run(
+            {"engine": engine, "packet_format": packet_format, "kernel_timestamps": kernel},
+            {"total_packets": int(rate * duration), "send_interval": 1, "burst": max(1, int(round(rate / 1000))),
+             "packet_format": packet_format, "kernel_timestamps": kernel})
+        result = {
+            "kernel_timestamps": kernel,
+            "stamp_to_echo_us": distribution(series["t_client_recv"] - series["t_server_recv"], 1e3),
+            "rtt_us": distribution(series["t_client_recv"] - series["t_client_send"], 1e3),
+        }
+        if kernel and server_log is not None and server_log.shape[1] >= 5:
+            kernel_time = server_log[3].astype(np.int64).to_numpy()
+            user_time = server_log[server_log.shape[1] - 1].astype(np.int64).to_numpy()
+            result["server_wakeup_us"] = distribution(user_time - kernel_time, 1e3)
+        results[engine] = result
+        echo = result["stamp_to_echo_us"]
+        print(f"  {engine}: stamp-to-echo p50 {echo.get('p50', 0):.1f} us, p99 {echo.get('p99', 0):.1f} us")
+    return results
+
+def bench_pacing(intervals, duration):
+    # Lateness of every send against its deadline, as recorded by the client
+    results = {}
+    for interval in intervals:
+        _, _, lateness, _ = echo_run({}, {"total_packets": max(1, int(duration * 1000 / interval)),
+                                          "send_interval": interval})
+        results[f"{interval}ms"] = distribution(lateness, 1e3)
+        print(f"  {interval} ms: lateness p50 {results[f'{interval}ms']['p50']:.1f} us, "
+              f"p99 {results[f'{interval}ms']['p99']:.1f} us")
+    return results
+
+def bench_writer(batch_sizes, max_lines_values, fsync_policies, lines):
+    # Cost of one RotatingWriter.write_lines call per flush, with server-like .psv records
+    record = "123456|1700000000000000000|abcdefghij|1700000000000012345"
+    results = []
+    for fsync in fsync_policies:
+        for max_lines in max_lines_values:
+            for batch_size in batch_sizes:
+                workdir = tempfile.mkdtemp(prefix="bench_writer_")
+                try:
+                    writer = RotatingWriter(workdir, 'packets_', '.psv', max_lines, fsync)
+                    batch = [record] * batch_size
+                    flushes = np.empty(max(1, lines // batch_size), dtype=np.int64)
+                    for i in range(len(flushes)):
+                        start = time.perf_counter_ns()
+                        writer.write_lines(batch)
+                        flushes[i] = time.perf_counter_ns() - start
+                    writer.close()
+                finally:
+                    shutil.rmtree(workdir, ignore_errors=True)
+                per_line_ns = flushes.sum() / (len(flushes) * batch_size)
+                results.append({"fsync": fsync, "max_lines": max_lines, "batch_size": batch_size,
+                                "flush_us": distribution(flushes, 1e3), "per_line_ns": float(per_line_ns),
+                                "lines_per_s": float(1e9 / per_line_ns)})
+                print(f"  fsync={fsync} max_lines={max_lines} batch_size={batch_size}: "
+                      f"{per_line_ns:.0f} ns/line")
+    return results
+
+BENCHMARKS = ('rate', 'overhead', 'pacing', 'writer')
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Loopback (::1) echo benchmarks for server.py and client.py")
+    parser.add_argument('--only', nargs='+', choices=BENCHMARKS, default=list(BENCHMARKS),
+                        help='Benchmarks to run (default: all)')
+    parser.add_argument('--duration', type=float, default=3.0, help='Seconds of traffic per echo run')
+    parser.add_argument('--rates', type=int, nargs='+', default=[1000, 2000, 5000, 10000, 20000, 50000],
+                        help='Offered rates (pps) for the sustained-rate sweep, in increasing order')
+    parser.add_argument('--max-loss', type=float, default=0.1, help='Loss (%%) still counted as sustained')
+    parser.add_argument('--engine', default='loop', choices=['threaded', 'loop', 'asyncio'],
+                        help='Server engine for the rate sweep')
+    parser.add_argument('--mmsg-batch', type=int, default=0, help='Server --mmsg-batch for the rate sweep (loop engine)')
+    parser.add_argument('--engines', nargs='+', default=['threaded', 'loop', 'asyncio'],
+                        help='Server engines compared by the overhead benchmark')
+    parser.add_argument('--overhead-rate', type=int, default=1000, help='Offered rate (pps) for the overhead benchmark')
+    parser.add_argument('--intervals', type=int, nargs='+', default=[1, 10], help='Send intervals (ms) for the pacing benchmark')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[10, 100, 500, 1000])
+    parser.add_argument('--max-lines', type=int, nargs='+', default=[10000, 120000])
+    parser.add_argument('--fsync', nargs='+', choices=FSYNC_POLICIES, default=['never', 'batch'])
+    parser.add_argument('--lines', type=int, default=200000, help='Lines written per writer configuration')
+    parser.add_argument('--output', help='Results file (default benchmarks/results/loopback_<time>.json)')
+    args = parser.parse_args()
+
+    results = {}
+    if 'rate' in args.only:
+        print("Sustained echo rate")
+        results["rate"] = bench_echo_rate(args.rates, args.duration, args.engine, args.mmsg_batch, args.max_loss)
+    if 'overhead' in args.only:
+        print("Server stamp-to-echo overhead")
+        results["overhead"] = bench_overhead(args.engines, args.overhead_rate, args.duration)
+    if 'pacing' in args.only:
+        print("Client pacing error")
+        results["pacing"] = bench_pacing(args.intervals, args.duration)
+    if 'writer' in args.only:
+        print("Writer flush cost")
+        results["writer"] = bench_writer(args.batch_sizes, args.max_lines, args.fsync, args.lines)
+    write_results("loopback", results, args.output)
@@ -0,0 +1,194 @@
+import os
+import re
+import json
+import argparse
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+# Synthetic experiments in the exact on-disk formats: client series_N.csv
+# (seq,t_client_send,payload,t_server_recv,t_client_recv, in receive order) and server
+# packets_N.psv (seq|t_client_send|payload|t_server_recv, in server receive order), both
+# rotated every max_lines lines. Latency is a base delay plus gamma jitter, with periodic
+# reconfiguration spikes; packets can be lost on either leg or delayed past their successors,
+# and the server clock can run ahead of the client's by a fixed offset plus a drift.
+
+BLOCK = 1_000_000  # packets generated at a time, so memory does not grow with the trace
+
+class ChunkedFile:
+    # Appends frames to <prefix><n><suffix>, starting a new file every max_lines lines
+    def __init__(self, directory, prefix, suffix, max_lines, sep):
+        self.directory = directory
+        self.prefix = prefix
+        self.suffix = suffix
+        self.max_lines = max_lines
+        self.sep = sep
+        self.counter = 1
+        self.lines = 0
+
+    def write(self, frame):
+        start = 0
+        while start < len(frame):
+            if self.lines >= self.max_lines:
+                self.counter += 1
+                self.lines = 0
+            stop = start + min(self.max_lines - self.lines, len(frame) - start)
+            path = os.path.join(self.directory, f"{self.prefix}{self.counter}{self.suffix}")
+            frame.iloc[start:stop].to_csv(path, mode='a', header=False, index=False, sep=self.sep)
+            self.lines += stop - start
+            start = stop
+
+def next_experiment(base_dir):
+    exp_nums = [int(d.split('_')[1]) for d in os.listdir(base_dir) if re.match(r'exp_\d+$', d)] \
+        if os.path.isdir(base_dir) else []
+    return max(exp_nums, default=0) + 1
+
+def spikes(t_s, period, width, amplitude, phase):
+    # amplitude (ms) during the first `width` seconds of every period
+    if period <= 0:
+        return np.zeros(len(t_s))
+    return np.where(np.mod(t_s - phase, period) < width, amplitude, 0.0)
+
+def generate(root='.', exp_number=None, packets=3_600_000, interval_ms=10, loss=0.001, reorder=0.0005,
+             reorder_ms=30.0, clock_offset_ms=0.0, drift_ppm=0.0, uplink_ms=20.0, downlink_ms=20.0,
+             jitter_ms=1.0, spike_period=15.0, spike_width=0.3, spike_ms=30.0, random_length=10,
+             max_lines=120000, seed=None, start=None):
+    rng = np.random.default_rng(seed)
+    client_base = os.path.join(root, 'results_client')
+    server_base = os.path.join(root, 'results_server')
+    if exp_number is None:
+        exp_number = max(next_experiment(client_base), next_experiment(server_base))
+    client_dir = os.path.join(client_base, f'exp_{exp_number}')
+    server_dir = os.path.join(server_base, f'exp_{exp_number}')
+    os.makedirs(client_dir)
+    os.makedirs(server_dir)
+
+    start = start or datetime.now()
+    t0 = int(start.timestamp() * 1e9)
+    interval_ns = int(interval_ms * 1e6)
+    phase = rng.uniform(0, spike_period) if spike_period > 0 else 0.0
+    pool = rng.choice(list('abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'),
+                      size=(4096, random_length))
+    payloads = np.array([''.join(row) for row in pool], dtype=object)
+
+    client_file = ChunkedFile(client_dir, 'series_', '.csv', max_lines, ',')
+    server_file = ChunkedFile(server_dir, 'packets_', '.psv', max_lines, '|')
+    counts = {"sent": 0, "received": 0, "lost": 0, "late": 0, "duplicates": 0, "reordered": 0, "unexpected": 0}
+    server_received = 0
+    for first in range(1, packets + 1, BLOCK):
+        seq = np.arange(first, min(first + BLOCK, packets + 1), dtype=np.int64)
+        n = len(seq)
+        # Sends on the pacing grid, a few tens of microseconds late
+        t_send = t0 + (seq - 1) * interval_ns + rng.exponential(40e3, n).astype(np.int64)
+        t_s = (t_send - t0) / 1e9
+        spike = spikes(t_s, spike_period, spike_width, spike_ms, phase)
+        up = uplink_ms + rng.gamma(2.0, jitter_ms / 2, n) + spike
+        down = downlink_ms + rng.gamma(2.0, jitter_ms / 2, n) + spike
+        up += np.where(rng.random(n) < reorder, rng.uniform(0, reorder_ms, n), 0.0)
+        down += np.where(rng.random(n) < reorder, rng.uniform(0, reorder_ms, n), 0.0)
+        arrival = t_send + (up * 1e6).astype(np.int64)  # true server receive time, client clock
+        t_server = arrival + int(clock_offset_ms * 1e6) + ((arrival - t0) * drift_ppm * 1e-6).astype(np.int64)
+        t_recv = arrival + (down * 1e6).astype(np.int64)
+        payload = payloads[rng.integers(0, len(payloads), n)]
+
+        # Loss is split evenly between the two legs
+        reached_server = rng.random(n) >= loss / 2
+        echoed = reached_server & (rng.random(n) >= loss / 2)
+
+        # Files are in arrival order; reordering only crosses packets of the same block
+        order = np.argsort(arrival[reached_server], kind='stable')
+        server_file.write(pd.DataFrame({
+            "seq": seq[reached_server][order], "t_client_send": t_send[reached_server][order],
+            "payload": payload[reached_server][order], "t_server_recv": t_server[reached_server][order]}))
+        order = np.argsort(t_recv[echoed], kind='stable')
+        client_seq = seq[echoed][order]
+        client_file.write(pd.DataFrame({
+            "seq": client_seq, "t_client_send": t_send[echoed][order], "payload": payload[echoed][order],
+            "t_server_recv": t_server[echoed][order], "t_client_recv": t_recv[echoed][order]}))
+
+        counts["sent"] += n
+        counts["received"] += int(echoed.sum())
+        counts["lost"] += int(n - echoed.sum())
+        counts["reordered"] += int(np.count_nonzero(client_seq < np.maximum.accumulate(client_seq)))
+        server_received += int(reached_server.sum())
+
+    duration = timedelta(seconds=packets * interval_ms / 1000)
+    parameters = {
+        "loss": loss, "reorder": reorder, "reorder_ms": reorder_ms, "clock_offset_ms": clock_offset_ms,
+        "drift_ppm": drift_ppm, "uplink_ms": uplink_ms, "downlink_ms": downlink_ms, "jitter_ms": jitter_ms,
+        "spike_period_s": spike_period, "spike_width_s": spike_width, "spike_ms": spike_ms,
+        "spike_phase_s": phase, "seed": seed,
+    }
+    client_config = {
+        "server_host": "::1",
+        "send_interval_ms": interval_ms,
+        "total_packets": packets,
+        "random_length": random_length,
+        "max_lines": max_lines,
+        "experiment_starts": start.strftime("%Y-%m-%d %H:%M:%S"),
+        "inflight": counts,
+        "experiment_ends": (start + duration).strftime("%Y-%m-%d %H:%M:%S"),
+        "synthetic": parameters,
+    }
+    with open(os.path.join(client_dir, "client_config.json"), "w") as f:
+        json.dump(client_config, f, indent=4)
+    server_config = {
+        "max_lines": max_lines,
+        "experiment_starts": start.strftime("%Y-%m-%d %H:%M:%S"),
+        "experiment_ends": (start + duration).strftime("%Y-%m-%d %H:%M:%S"),
+        "total_packets": server_received,
+        "synthetic": parameters,
+    }
+    with open(os.path.join(server_dir, "server_config.json"), "w") as f:
+        json.dump(server_config, f, indent=4)
+    return exp_number, counts
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write a synthetic experiment in the client and server file formats")
+    parser.add_argument('--root', default='.', help='Directory holding results_client/ and results_server/')
+    parser.add_argument('--exp', type=int, help='Experiment number (default: the next free one)')
+    parser.add_argument('--packets', type=int, default=3_600_000, help='Packets sent')
+    parser.add_argument('--interval-ms', type=float, default=10, help='Send interval (ms)')
+    parser.add_argument('--loss', type=float, default=0.001, help='Round-trip loss probability, split between both legs')
+    parser.add_argument('--reorder', type=float, default=0.0005,
+                        help='Probability, per leg, that a packet is held back by up to --reorder-ms')
+    parser.add_argument('--reorder-ms', type=float, default=30.0, help='Largest extra delay of a reordered packet (ms)')
+    parser.add_argument('--clock-offset-ms', type=float, default=0.0, help='Server clock minus client clock (ms)')
+    parser.add_argument('--drift-ppm', type=float, default=0.0, help='Server clock drift against the client (ppm)')
+    parser.add_argument('--uplink-ms', type=float, default=20.0, help='Base uplink delay (ms)')
+    parser.add_argument('--downlink-ms', type=float, default=20.0, help='Base downlink delay (ms)')
+    parser.add_argument('--jitter-ms', type=float, default=1.0, help='Mean gamma-distributed jitter per leg (ms)')
+    parser.add_argument('--spike-period', type=float, default=15.0, help='Seconds between latency spikes (0 disables)')
+    parser.add_argument('--spike-width', type=float, default=0.3, help='Spike duration (s)')
+    parser.add_argument('--spike-ms', type=float, default=30.0, help='Extra delay during a spike, per leg (ms)')
+    parser.add_argument('--random-length', type=int, default=10, help='Payload length')
+    parser.add_argument('--max-lines', type=int, default=120000, help='Lines per series/packets file')
+    parser.add_argument('--seed', type=int, help='Random seed')
+    parser.add_argument('--start', type=lambda value: datetime.strptime(value, "%Y-%m-%d %H:%M:%S"),
+                        metavar='"YYYY-MM-DD HH:MM:SS"', help='Experiment start time (default: now)')
+    args = parser.parse_args()
+
+    exp_number, counts = generate(
+        root=args.root,
+        exp_number=args.exp,
+        packets=args.packets,
+        interval_ms=args.interval_ms,
+        loss=args.loss,
+        reorder=args.reorder,
+        reorder_ms=args.reorder_ms,
+        clock_offset_ms=args.clock_offset_ms,
+        drift_ppm=args.drift_ppm,
+        uplink_ms=args.uplink_ms,
+        downlink_ms=args.downlink_ms,
+        jitter_ms=args.jitter_ms,
+        spike_period=args.spike_period,
+        spike_width=args.spike_width,
+        spike_ms=args.spike_ms,
+        random_length=args.random_length,
+        max_lines=args.max_lines,
+        seed=args.seed,
+        start=args.start
+    )
+    print(f"exp_{exp_number}: {counts['sent']} packets sent, {counts['received']} echoed, "
+          f"{counts['lost']} lost, {counts['reordered']} reordered")
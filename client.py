@@ -1,6 +1,7 @@
 import socket
 import time
 import threading
+import asyncio
 import random
 import string
 import os
@@ -9,13 +10,25 @@ import json
 from datetime import datetime
 import argparse
 import configparser
+from array import array
+import wire_format
+import timestamps
+import mmsg
+from rotating_writer import RotatingWriter, FSYNC_POLICIES
+from columnar import ColumnarWriter, write_npy, COLUMNS
+from pacing import Pacer, PACING_MODES, lateness_summary
+from inflight import InflightTable
+from histogram import LatencyStats
 
 class UDPClient:
     def __init__(self, server_host='::1', server_port=12345,
                  client_host='::', client_port=0, 
                  send_interval=1000, total_packets=1000, 
                  response_timeout=10, random_length=10,
-                 batch_size=100, max_lines=10000):
+                 batch_size=100, max_lines=10000, engine='threaded',
+                 packet_format='text', packet_size=64, fsync='never', storage='csv',
+                 pacing='fixed', jitter=0, spin=200, window=65536, stats_interval=10,
+                 kernel_timestamps=False, burst=1):
         self.server_host = server_host
         self.server_port = server_port
         self.client_host = client_host
@@ -26,13 +39,50 @@ class UDPClient:
         self.random_length = random_length
         self.batch_size = batch_size
         self.max_lines = max_lines
+        self.engine = engine
+        self.packet_format = packet_format
+        self.packet_size = packet_size
+        self.fsync = fsync
+        self.storage = storage
+        self.kernel_timestamps = kernel_timestamps
+        self.burst = burst
+        self.pacer = Pacer(self.send_interval, pacing, jitter / 1000, spin / 1e6)  # ms and us to seconds
+        self.send_lateness = array('q')
+        self.inflight = InflightTable(window)
+        self.latency = LatencyStats(stats_interval)
         self.responses = []
-        self.file_counter = 1
         self.packets_sent = 0
         self.lock = threading.Lock()
         self.running = True
         self.server_ack = False
-        self.first_run = True
+        self.malformed_responses = 0
+
+        # Payload bodies are pregenerated once, the send loop only slices this pool by offset
+        self.payload_pool = self.generate_random_string(max(65536, 64 * random_length, packet_size)).encode('utf-8')
+        self.pool_span = len(self.payload_pool) - random_length + 1
+
+        # Binary packets are built in place in one fixed-size buffer
+        if self.packet_format == 'binary':
+            self.packet_buffer = wire_format.new_packet(packet_size, self.payload_pool)
+
+        # Create a single socket for both sending and receiving
+        self.sock = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_V6ONLY, 0)
+        self.sock.bind((self.client_host, self.client_port))
+        self.client_port = self.sock.getsockname()[1]  # update to actual port
+
+        # Kernel receive timestamps need recvmsg on the blocking listener thread
+        if self.kernel_timestamps:
+            if self.engine == 'asyncio':
+                print("Kernel timestamps are not available with the asyncio engine; using userspace time")
+                self.kernel_timestamps = False
+            elif not timestamps.enable(self.sock):
+                print("SO_TIMESTAMPNS not supported here; using userspace time")
+                self.kernel_timestamps = False
+        # Packet-train echoes are read with recvmmsg, which takes kernel times where supported
+        batch_rx = self.burst > 1 and self.engine == 'threaded' and mmsg.available()
+        kernel_rx = self.kernel_timestamps or (batch_rx and timestamps.enable(self.sock))
+        self.rx_timestamps = 'kernel' if kernel_rx else 'user'
 
         # Create storage directory if it doesn't exist
         base_dir = 'results_client'
@@ -58,131 +108,257 @@ class UDPClient:
             "random_length": self.random_length,
             "batch_size": self.batch_size,
             "max_lines": self.max_lines,
+            "engine": self.engine,
+            "packet_format": self.packet_format,
+            "packet_size": self.packet_size if self.packet_format == 'binary' else None,
+            "fsync": self.fsync,
+            "storage": self.storage,
+            "pacing": pacing,
+            "jitter_ms": jitter,
+            "spin_us": spin,
+            "window": window,
+            "stats_interval_s": stats_interval,
+            "kernel_timestamps": self.kernel_timestamps,
+            "burst": self.burst,
+            "rx_timestamps": self.rx_timestamps,
             "experiment_starts": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         }
         self.config_path = os.path.join(self.exp_dir, "client_config.json")
         with open(self.config_path, "w") as f:
             json.dump(self.config_dict, f, indent=4)
 
-        # Create a single socket for both sending and receiving
-        self.sock = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM)
-        self.sock.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_V6ONLY, 0)
-        self.sock.bind((self.client_host, self.client_port))
-        self.client_port = self.sock.getsockname()[1]  # update to actual port
+        if self.storage == 'npy':
+            columns = COLUMNS + ('t_client_recv_user',) if self.kernel_timestamps else COLUMNS
+            self.writer = ColumnarWriter(self.exp_dir, 'series_', self.max_lines, self.config_dict, self.fsync, columns)
+        else:
+            self.writer = RotatingWriter(self.exp_dir, 'series_', '.csv', self.max_lines, self.fsync, skip_existing=True)
 
     def generate_random_string(self, length):
-        return ''.join(random.choice(string.ascii_letters + string.digits) for _ in range(length))
+        return ''.join(random.choices(string.ascii_letters + string.digits, k=length))
     
     def save_responses(self, force=False):
         with self.lock:
             if not self.responses:
                 return
-            
-            # If first run, start a new file
-            if self.first_run:
-                self.first_run = False
-                filename = os.path.join(self.exp_dir, f'series_{self.file_counter}.csv')
-                while os.path.exists(filename):
-                    self.file_counter += 1
-                    filename = os.path.join(self.exp_dir, f'series_{self.file_counter}.csv')
-                
+
             if force or len(self.responses) >= self.batch_size:
-                filename = os.path.join(self.exp_dir, f'series_{self.file_counter}.csv')
-                line_count = 0
-                
-                # Check if current file exists and count lines
-                if os.path.exists(filename):
-                    with open(filename, 'r') as f:
-                        line_count = sum(1 for _ in f)
-                
-                # If current file would exceed max_lines or its the first run, create new file
-                if line_count + len(self.responses) > self.max_lines:
-                    remaining_space = self.max_lines - line_count
-                    self.file_counter += 1
-                    filename = os.path.join(self.exp_dir, f'series_{self.file_counter}.csv')
-                    
-                    # Save remaining responses that fit in current file
-                    if remaining_space > 0:
-                        with open(os.path.join(self.exp_dir, f'series_{self.file_counter-1}.csv'), 'a') as f:
-                            for response in self.responses[:remaining_space]:
-                                f.write(response + '\n')
-                        self.responses = self.responses[remaining_space:]
-                
-                # Save responses to file
-                with open(filename, 'a') as f:
-                    for response in self.responses:
-                        f.write(response + '\n')
+                if self.storage == 'npy':
+                    self.writer.write_records(self.responses)
+                else:
+                    self.writer.write_lines(self.responses)
                 self.responses = []
     
+    def response_received(self, data, current_time, user_time=None):
+        # Stragglers after finish() has started are dropped, the writer is being closed
+        if not self.running:
+            return
+        if not self.server_ack:
+            self.server_ack = True
+            print("Server responses incoming ... ")
+
+        if self.packet_format == 'binary':
+            if len(data) < wire_format.MIN_PACKET_SIZE or data[0] != wire_format.VERSION:
+                self.malformed_responses += 1
+                return
+            record = wire_format.unpack(data)
+        else:
+            try:
+                record = wire_format.unpack_text(data)
+            except (ValueError, IndexError):
+                self.malformed_responses += 1
+                return
+        seq, t_send, t_server = record
+
+        # With kernel timestamps, current_time is the kernel receive time and the
+        # userspace time is kept as an extra trailing column
+        extra = () if user_time is None else (user_time,)
+        if self.storage == 'npy':
+            modified_data = (*record, current_time, *extra)
+        elif self.packet_format == 'binary':
+            modified_data = wire_format.to_csv(record, current_time, *extra)
+        else:
+            modified_data = f"{data.decode('utf-8')}|{current_time}"
+            modified_data = modified_data.replace('|', ",")  # Replace '|' with ',' for CSV format
+            if extra:
+                modified_data += f",{user_time}"
+
+        self.latency.record(t_send, t_server, current_time)
+        self.inflight.acknowledge(seq)
+        with self.lock:
+            self.responses.append(modified_data)
+            if len(self.responses) >= self.batch_size:
+                threading.Thread(target=self.save_responses).start()
+
+    def listen_for_batches(self):
+        # Echoes of packet trains come back in bursts too, take them with recvmmsg
+        rx = mmsg.BatchReceiver(self.sock, self.burst, 1024)
+        while self.running:
+            n = rx.recv()
+            for i in range(n):
+                current_time = rx.kernel_time(i) or rx.user_time
+                user_time = rx.user_time if self.kernel_timestamps else None
+                self.response_received(bytes(rx.buffers[i][:rx.length(i)]), current_time, user_time)
+
     def listen_for_responses(self):
         try:
+            if self.burst > 1 and mmsg.available():
+                self.listen_for_batches()
             while self.running:
                 try:
-                    data, _ = self.sock.recvfrom(1024)
-                    current_time = str(time.time_ns())
-
-                    if not self.server_ack:
-                        self.server_ack = True
-                        print("Server responses incoming ... ")
-
-                    modified_data = f"{data.decode('utf-8')}|{current_time}"
-                    modified_data = modified_data.replace('|', ",")  # Replace '|' with ',' for CSV format
-                    
-                    with self.lock:
-                        self.responses.append(modified_data)
-                        if len(self.responses) >= self.batch_size:
-                            threading.Thread(target=self.save_responses).start()
+                    if self.kernel_timestamps:
+                        data, _, kernel_time, user_time = timestamps.recv(self.sock, 1024)
+                        self.response_received(data, kernel_time or user_time, user_time)
+                    else:
+                        data, _ = self.sock.recvfrom(1024)
+                        current_time = time.time_ns()
+                        self.response_received(data, current_time)
                 except socket.error:
                     if self.running:
                         raise
         finally:
             self.sock.close()
 
+    def build_payload(self, seq):
+        if self.packet_format == 'binary':
+            wire_format.stamp_client(self.packet_buffer, seq, time.time_ns())
+            return self.packet_buffer
+
+        offset = (seq * self.random_length) % self.pool_span
+        random_bytes = self.payload_pool[offset:offset + self.random_length]
+
+        # Get time just before assembling the packet
+        return b"%d|%d|" % (seq, time.time_ns()) + random_bytes
+
+    def finish(self):
+        self.running = False
+        self.save_responses(force=True)
+        self.writer.close()
+        if self.malformed_responses:
+            print(f"Dropped {self.malformed_responses} responses not matching the {self.packet_format} format")
+        # Lateness of every send against its scheduled deadline, indexed by seq - 1
+        write_npy(os.path.join(self.exp_dir, "send_lateness.npy"), self.send_lateness)
+        self.config_dict["send_lateness"] = lateness_summary(self.send_lateness)
+        self.inflight.finalize()
+        self.config_dict["inflight"] = self.inflight.snapshot()
+        print(f"Final: {self.inflight.summary()}")
+        print(self.latency.report())
+        with open(os.path.join(self.exp_dir, "latency_histogram.json"), "w") as f:
+            json.dump(self.latency.to_dict(), f)
+        # Log experiment end time
+        self.config_dict["experiment_ends"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with open(self.config_path, "w") as f:
+            json.dump(self.config_dict, f, indent=4)
+        print("Client finished.")
+
     def send_packets(self):
         print(f"Client sending from port {self.client_port}")
 
+        # Bursts go out as packet trains, one sendmmsg per train where available
+        sender = None
+        if self.burst > 1:
+            if mmsg.available():
+                sender = mmsg.BatchSender(self.sock, self.server_host, self.server_port, self.burst,
+                                          max(2048, self.packet_size))
+            else:
+                print("sendmmsg not available here; sending each packet of a burst separately")
+
         try:
-            for seq in range(1, self.total_packets + 1):
+            self.pacer.start()
+            for first in range(1, self.total_packets + 1, self.burst):
                 if not self.running:
                     break
-                    
-                random_str = self.generate_random_string(self.random_length)
-
-                # Get time just before assembling the packet
-                current_time = str(time.time_ns())
-                payload = f"{seq}|{current_time}|{random_str}"
-                
-                self.sock.sendto(payload.encode('utf-8'), (self.server_host, self.server_port))
-                self.packets_sent += 1
-                
-                if seq % 500 == 0:
-                    print(f"Sent {seq} packets")
-                
-                time.sleep(self.send_interval)
+
+                lateness = self.pacer.wait()
+                last = min(first + self.burst, self.total_packets + 1)
+                for i, seq in enumerate(range(first, last)):
+                    self.inflight.register(seq)
+                    # Every packet is stamped as it is built, right before the train is sent
+                    payload = self.build_payload(seq)
+                    if sender is not None:
+                        sender.put(i, payload)
+                    else:
+                        self.sock.sendto(payload, (self.server_host, self.server_port))
+                    self.send_lateness.append(lateness)
+                if sender is not None:
+                    sender.send(0, last - first)
+                self.packets_sent += last - first
+                self.pacer.advance()
+
+                if (last - 1) // 500 > (first - 1) // 500:
+                    print(f"Sent {last - 1} packets | {self.inflight.summary()}")
             
             # After sending all packets, wait for responses
             print(f"All packets sent. Waiting {self.response_timeout} seconds for responses...")
             time.sleep(self.response_timeout)
-            self.running = False
-            self.save_responses(force=True)
-            # Log experiment end time
-            self.config_dict["experiment_ends"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            with open(self.config_path, "w") as f:
-                json.dump(self.config_dict, f, indent=4)
-            print("Client finished.")
+            self.finish()
         finally:
             self.sock.close()
-    
+
+    async def send_packets_async(self, transport):
+        print(f"Client sending from port {self.client_port}")
+
+        # Same absolute deadlines as the threaded engine, waited on with loop timers (no spinning)
+        self.pacer.start()
+        for seq in range(1, self.total_packets + 1):
+            if not self.running:
+                break
+
+            await asyncio.sleep(max(0, self.pacer.remaining_ns() / 1e9))
+            lateness = -self.pacer.remaining_ns()
+            self.inflight.register(seq)
+            transport.sendto(self.build_payload(seq), (self.server_host, self.server_port))
+            self.packets_sent += 1
+            self.send_lateness.append(lateness)
+            self.pacer.advance()
+
+            if seq % 500 == 0:
+                print(f"Sent {seq} packets | {self.inflight.summary()}")
+
+        print(f"All packets sent. Waiting {self.response_timeout} seconds for responses...")
+        await asyncio.sleep(self.response_timeout)
+
+    async def run_asyncio(self):
+        loop = asyncio.get_running_loop()
+        transport, _ = await loop.create_datagram_endpoint(lambda: ResponseProtocol(self), sock=self.sock)
+        try:
+            await self.send_packets_async(transport)
+        finally:
+            # No more echoes are delivered once the flush starts
+            transport.close()
+        # Flushing touches the disk, keep it off the event loop
+        await loop.run_in_executor(None, self.finish)
+
     def start(self):
 
         print("Sending packets to", self.server_host, "at port", self.server_port)
 
+        if self.engine == 'asyncio':
+            asyncio.run(self.run_asyncio())
+            return
+
         # Start response listener thread
         threading.Thread(target=self.listen_for_responses, daemon=True).start()
         
         # Start sending packets
         self.send_packets()
 
+class ResponseProtocol(asyncio.DatagramProtocol):
+    def __init__(self, client):
+        self.client = client
+
+    def datagram_received(self, data, addr):
+        self.client.response_received(data, time.time_ns())
+
+    def error_received(self, exc):
+        print(f"Socket error: {exc}")
+
+def run_flows(clients):
+    # Drive several probe flows, each with its own socket, from a single event loop
+    async def run_all():
+        await asyncio.gather(*(client.run_asyncio() for client in clients))
+
+    asyncio.run(run_all())
+
 def load_config(config_file, section):
     config = configparser.ConfigParser()
     config.read(config_file)
@@ -197,6 +373,19 @@ def load_config(config_file, section):
         if 'random_length' in s: cfg['random_length'] = int(s['random_length'])
         if 'batch_size' in s: cfg['batch_size'] = int(s['batch_size'])
         if 'max_lines' in s: cfg['max_lines'] = int(s['max_lines'])
+        if 'engine' in s: cfg['engine'] = s['engine']
+        if 'flows' in s: cfg['flows'] = int(s['flows'])
+        if 'packet_format' in s: cfg['packet_format'] = s['packet_format']
+        if 'packet_size' in s: cfg['packet_size'] = int(s['packet_size'])
+        if 'fsync' in s: cfg['fsync'] = s['fsync']
+        if 'storage' in s: cfg['storage'] = s['storage']
+        if 'pacing' in s: cfg['pacing'] = s['pacing']
+        if 'jitter_ms' in s: cfg['jitter_ms'] = float(s['jitter_ms'])
+        if 'spin_us' in s: cfg['spin_us'] = float(s['spin_us'])
+        if 'window' in s: cfg['window'] = int(s['window'])
+        if 'stats_interval' in s: cfg['stats_interval'] = float(s['stats_interval'])
+        if 'kernel_timestamps' in s: cfg['kernel_timestamps'] = s.getboolean('kernel_timestamps')
+        if 'burst' in s: cfg['burst'] = int(s['burst'])
     return cfg
 
 if __name__ == "__main__":
@@ -210,6 +399,28 @@ if __name__ == "__main__":
     parser.add_argument('--random-length', type=int, help='Random string length')
     parser.add_argument('--batch-size', type=int, help='Batch size for saving responses')
     parser.add_argument('--max-lines', type=int, help='Max lines per file')
+    parser.add_argument('--engine', type=str, choices=['threaded', 'asyncio'],
+                        help='threaded: blocking socket plus listener thread, asyncio: datagram endpoint on an event loop')
+    parser.add_argument('--flows', type=int, help='Concurrent probe flows in one process (asyncio engine)')
+    parser.add_argument('--packet-format', type=str, choices=wire_format.FORMATS,
+                        help='text: pipe separated strings, binary: fixed-width uint64 fields')
+    parser.add_argument('--packet-size', type=int,
+                        help=f'Exact packet size in bytes for the binary format (min {wire_format.MIN_PACKET_SIZE})')
+    parser.add_argument('--fsync', type=str, choices=FSYNC_POLICIES,
+                        help='When to fsync output files: never, after every batch, or on rotation')
+    parser.add_argument('--storage', type=str, choices=['csv', 'npy'],
+                        help='csv: text series files, npy: columnar int64 chunks readable with numpy memory maps')
+    parser.add_argument('--pacing', type=str, choices=PACING_MODES,
+                        help='Send schedule: fixed interval, poisson arrivals, or uniform jitter around the interval')
+    parser.add_argument('--jitter-ms', type=float, help='Max jitter around the interval for uniform pacing (ms)')
+    parser.add_argument('--spin-us', type=float, help='Busy-wait this long before each deadline instead of sleeping (us)')
+    parser.add_argument('--window', type=int,
+                        help='In-flight window in packets; unanswered after this many later sends counts as lost')
+    parser.add_argument('--stats-interval', type=float, help='Seconds between rolling latency percentile reports (0 disables)')
+    parser.add_argument('--kernel-timestamps', action='store_true', default=None,
+                        help='Use kernel receive time (SO_TIMESTAMPNS) for t_client_recv and also store the userspace time')
+    parser.add_argument('--burst', type=int,
+                        help='Packets per send interval, sent back to back as a train with one sendmmsg (threaded engine)')
     args = parser.parse_args()
 
     config = {}
@@ -225,15 +436,54 @@ if __name__ == "__main__":
     random_length = args.random_length or config.get('random_length', 20)
     batch_size = args.batch_size or config.get('batch_size', 100)
     max_lines = args.max_lines or config.get('max_lines', 10000)
+    engine = args.engine or config.get('engine', 'threaded')
+    flows = args.flows or config.get('flows', 1)
+    packet_format = args.packet_format or config.get('packet_format', 'text')
+    packet_size = args.packet_size or config.get('packet_size', 64)
+    fsync = args.fsync or config.get('fsync', 'never')
+    storage = args.storage or config.get('storage', 'csv')
+    pacing = args.pacing or config.get('pacing', 'fixed')
+    jitter = args.jitter_ms if args.jitter_ms is not None else config.get('jitter_ms', 0)
+    spin = args.spin_us if args.spin_us is not None else config.get('spin_us', 200)
+    window = args.window or config.get('window', 65536)
+    kernel_timestamps = args.kernel_timestamps or config.get('kernel_timestamps', False)
+    burst = args.burst or config.get('burst', 1)
+    stats_interval = args.stats_interval if args.stats_interval is not None else config.get('stats_interval', 10)
+
+    if flows > 1 and engine != 'asyncio':
+        parser.error("--flows requires --engine asyncio")
+    if burst > 1 and engine != 'threaded':
+        parser.error("--burst requires --engine threaded")
+
+    # Every flow gets its own socket and experiment directory
+    clients = [
+        UDPClient(
+            server_host=server_host,
+            server_port=server_port,
+            send_interval=send_interval,
+            total_packets=total_packets,
+            response_timeout=response_timeout,
+            random_length=random_length,
+            batch_size=batch_size,
+            max_lines=max_lines,
+            engine=engine,
+            packet_format=packet_format,
+            packet_size=packet_size,
+            fsync=fsync,
+            storage=storage,
+            pacing=pacing,
+            jitter=jitter,
+            spin=spin,
+            window=window,
+            stats_interval=stats_interval,
+            kernel_timestamps=kernel_timestamps,
+            burst=burst
+        )
+        for _ in range(flows)
+    ]
 
-    client = UDPClient(
-        server_host=server_host,
-        server_port=server_port,
-        send_interval=send_interval,
-        total_packets=total_packets,
-        response_timeout=response_timeout,
-        random_length=random_length,
-        batch_size=batch_size,
-        max_lines=max_lines
-    )
-    client.start()
\ No newline at end of file
+    if len(clients) > 1:
+        print(f"Running {len(clients)} flows against", server_host, "at port", server_port)
+        run_flows(clients)
+    else:
+        clients[0].start()
\ No newline at end of file
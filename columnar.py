@@ -0,0 +1,132 @@
+import os
+import sys
+import json
+import glob
+import re
+from array import array
+
+from rotating_writer import FSYNC_POLICIES
+
+# Client responses as columnar chunks: one little-endian int64 .npy file per column
+# (series_<n>.<column>.npy) plus a series_<n>.json header with the experiment config.
+# Written with the standard library only, so the client does not need NumPy.
+COLUMNS = ('seq', 't_client_send', 't_server_recv', 't_client_recv')
+
+NPY_MAGIC = b'\x93NUMPY\x01\x00'
+# Fixed preamble size so the shape can be rewritten in place after every append
+NPY_PREAMBLE = 128
+
+def npy_header(length, descr='<i8'):
+    header = f"{{'descr': '{descr}', 'fortran_order': False, 'shape': ({length},), }}"
+    header = header.ljust(NPY_PREAMBLE - len(NPY_MAGIC) - 2 - 1) + '\n'
+    return NPY_MAGIC + len(header).to_bytes(2, 'little') + header.encode('latin1')
+
+def int64_bytes(values):
+    column = array('q', values)
+    if sys.byteorder == 'big':
+        column.byteswap()
+    return column.tobytes()
+
+def write_npy(path, values):
+    # One-shot int64 .npy for side outputs such as per-packet send lateness
+    with open(path, 'wb') as f:
+        f.write(npy_header(len(values)))
+        f.write(int64_bytes(values))
+
+class ColumnarWriter:
+    def __init__(self, directory, prefix, max_lines, header=None, fsync='never', columns=COLUMNS):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"fsync must be one of {FSYNC_POLICIES}")
+        self.directory = directory
+        self.prefix = prefix
+        self.max_lines = max_lines
+        self.header = header or {}
+        self.fsync = fsync
+        self.columns = columns
+        self.file_counter = 1
+        self.line_count = 0
+        self.files = None
+
+        while os.path.exists(self.header_path()):
+            self.file_counter += 1
+
+    def header_path(self):
+        return os.path.join(self.directory, f'{self.prefix}{self.file_counter}.json')
+
+    def column_path(self, column):
+        return os.path.join(self.directory, f'{self.prefix}{self.file_counter}.{column}.npy')
+
+    def write_header(self):
+        with open(self.header_path(), 'w') as f:
+            json.dump({"columns": list(self.columns), "dtype": "<i8", "rows": self.line_count,
+                       "config": self.header}, f, indent=4)
+
+    def open_current(self):
+        self.line_count = 0
+        self.files = []
+        for column in self.columns:
+            f = open(self.column_path(column), 'wb')
+            f.write(npy_header(0))
+            self.files.append(f)
+        self.write_header()
+
+    def close_current(self):
+        # A finished chunk is never reopened: later records, even after close(), start the next one
+        if self.files is None:
+            return
+        for f in self.files:
+            f.flush()
+            if self.fsync != 'never':
+                os.fsync(f.fileno())
+            f.close()
+        self.write_header()
+        self.files = None
+        self.file_counter += 1
+
+    def write_records(self, records):
+        start = 0
+        while start < len(records):
+            if self.files is None:
+                self.open_current()
+            space = self.max_lines - self.line_count
+            if space <= 0:
+                self.close_current()
+                continue
+            chunk = records[start:start + space]
+            self.line_count += len(chunk)
+            for i, f in enumerate(self.files):
+                f.write(int64_bytes([record[i] for record in chunk]))
+                # Keep the file a valid .npy after every batch so it can be read mid-run
+                f.seek(0)
+                f.write(npy_header(self.line_count))
+                f.seek(0, os.SEEK_END)
+            start += len(chunk)
+
+        if self.files is not None:
+            for f in self.files:
+                f.flush()
+                if self.fsync == 'batch':
+                    os.fsync(f.fileno())
+
+    def close(self):
+        self.close_current()
+
+def series_numbers(exp_dir, prefix='series_'):
+    numbers = []
+    for path in glob.glob(os.path.join(exp_dir, f'{prefix}*.json')):
+        match = re.search(rf'{prefix}(\d+)\.json$', path)
+        if match:
+            numbers.append(int(match.group(1)))
+    return sorted(numbers)
+
+def load_series(exp_dir, series_number, prefix='series_', mmap=True):
+    # Returns {column: int64 array}, memory-mapped unless mmap is False
+    import numpy as np
+
+    with open(os.path.join(exp_dir, f'{prefix}{series_number}.json'), 'r') as f:
+        header = json.load(f)
+    mode = 'r' if mmap else None
+    return {
+        column: np.load(os.path.join(exp_dir, f'{prefix}{series_number}.{column}.npy'), mmap_mode=mode)
+        for column in header["columns"]
+    }
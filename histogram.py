@@ -0,0 +1,205 @@
+import math
+from array import array
+
+class LogHistogram:
+    # HDR-style log-linear histogram of non-negative integers (ns). Values below
+    # 2**sub_bits get exact buckets; above that every power of two is split into
+    # 2**(sub_bits - 1) buckets, so the relative error stays under 2**(1 - sub_bits).
+    # Recording is O(1) and memory is fixed by max_value and sub_bits.
+    def __init__(self, sub_bits=7, max_value=2**40):
+        self.sub_bits = sub_bits
+        self.sub_count = 1 << sub_bits
+        self.half = self.sub_count >> 1
+        self.max_value = max_value
+        self.counts = array('Q', [0]) * (self.index(max_value) + 1)
+        self.total = 0
+        self.clamped = 0
+        self.min = None
+        self.max = None
+
+    def index(self, value):
+        if value < self.sub_count:
+            return value
+        shift = value.bit_length() - self.sub_bits
+        return (shift + 1) * self.half + ((value >> shift) - self.half)
+
+    def bucket_bounds(self, index):
+        # [low, high) of the values that fall into a bucket
+        if index < self.sub_count:
+            return index, index + 1
+        shift = index // self.half - 1
+        low = (index % self.half + self.half) << shift
+        return low, low + (1 << shift)
+
+    def record(self, value):
+        # Negative values (e.g. one-way delays under clock offset) and values past max_value are clamped
+        if value < 0 or value > self.max_value:
+            self.clamped += 1
+            value = 0 if value < 0 else self.max_value
+        self.counts[self.index(value)] += 1
+        self.total += 1
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def record_array(self, values):
+        # record() for a whole NumPy array at once, for offline aggregation of stored series
+        import numpy as np
+        values = np.asarray(values, dtype=np.int64)
+        if not len(values):
+            return
+        self.clamped += int(np.count_nonzero((values < 0) | (values > self.max_value)))
+        values = np.clip(values, 0, self.max_value)
+        _, bit_length = np.frexp(values.astype(np.float64))  # exact below 2**53
+        shift = np.maximum(bit_length - self.sub_bits, 0)
+        index = np.where(values < self.sub_count, values, (shift + 1) * self.half + ((values >> shift) - self.half))
+        counts = np.bincount(index, minlength=len(self.counts))
+        for i in np.flatnonzero(counts):
+            self.counts[i] += int(counts[i])
+        self.total += len(values)
+        low, high = int(values.min()), int(values.max())
+        self.min = low if self.min is None else min(self.min, low)
+        self.max = high if self.max is None else max(self.max, high)
+
+    def percentile(self, q):
+        if not self.total:
+            return None
+        target = max(1, math.ceil(q / 100 * self.total))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                low, high = self.bucket_bounds(index)
+                return min(max((low + high - 1) // 2, self.min), self.max)
+        return self.max
+
+    def merge(self, other):
+        for index, count in enumerate(other.counts):
+            if count:
+                self.counts[index] += count
+        self.total += other.total
+        self.clamped += other.clamped
+        if other.total:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+            self.max = other.max if self.max is None else max(self.max, other.max)
+
+    def reset(self):
+        for index in range(len(self.counts)):
+            self.counts[index] = 0
+        self.total = 0
+        self.clamped = 0
+        self.min = None
+        self.max = None
+
+    def to_dict(self):
+        return {
+            "sub_bits": self.sub_bits,
+            "max_value": self.max_value,
+            "total": self.total,
+            "clamped": self.clamped,
+            "min": self.min,
+            "max": self.max,
+            "buckets": [[self.bucket_bounds(i)[0], count] for i, count in enumerate(self.counts) if count],
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        hist = cls(d["sub_bits"], d["max_value"])
+        for low, count in d["buckets"]:
+            hist.counts[hist.index(low)] = count
+        hist.total = d["total"]
+        hist.clamped = d["clamped"]
+        hist.min = d["min"]
+        hist.max = d["max"]
+        return hist
+
+class Moments:
+    # Count, mean, variance, min and max of a stream of floats. Two of them merge exactly
+    # (Chan et al. pairwise update), so per-run summaries can be pooled without the samples
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+
+    def record_array(self, values):
+        import numpy as np
+        values = np.asarray(values, dtype=np.float64)
+        if not len(values):
+            return
+        other = Moments()
+        other.count = len(values)
+        other.mean = float(values.mean())
+        other.m2 = float(np.sum((values - other.mean) ** 2))
+        other.min = float(values.min())
+        other.max = float(values.max())
+        self.merge(other)
+
+    def merge(self, other):
+        if not other.count:
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+
+    @property
+    def std(self):
+        return math.sqrt(self.m2 / self.count) if self.count else None
+
+    def to_dict(self):
+        return {"count": self.count, "mean": self.mean, "m2": self.m2, "min": self.min, "max": self.max}
+
+    @classmethod
+    def from_dict(cls, d):
+        moments = cls()
+        moments.count = d["count"]
+        moments.mean = d["mean"]
+        moments.m2 = d["m2"]
+        moments.min = d["min"]
+        moments.max = d["max"]
+        return moments
+
+PERCENTILES = (50, 90, 99, 99.9)
+DIRECTIONS = ('uplink', 'downlink', 'rtt')
+
+class LatencyStats:
+    # Cumulative and rolling-window histograms for uplink, downlink and RTT
+    def __init__(self, interval=10):
+        self.interval_ns = int(interval * 1e9)
+        self.total = {d: LogHistogram() for d in DIRECTIONS}
+        self.window = {d: LogHistogram() for d in DIRECTIONS}
+        self.window_start = None
+
+    def record(self, t_send, t_server, t_recv):
+        samples = (t_server - t_send, t_recv - t_server, t_recv - t_send)
+        for direction, value in zip(DIRECTIONS, samples):
+            self.total[direction].record(value)
+            self.window[direction].record(value)
+
+        if self.window_start is None:
+            self.window_start = t_recv
+        elif self.interval_ns and t_recv - self.window_start >= self.interval_ns:
+            print(self.report(self.window))
+            for hist in self.window.values():
+                hist.reset()
+            self.window_start = t_recv
+
+    def report(self, hists=None):
+        hists = hists or self.total
+        parts = []
+        for direction in DIRECTIONS:
+            hist = hists[direction]
+            if not hist.total:
+                continue
+            values = " ".join(f"p{q:g}={hist.percentile(q) / 1e6:.3f}" for q in PERCENTILES)
+            parts.append(f"{direction}: {values} max={hist.max / 1e6:.3f}")
+        return "Latency [ms] " + " | ".join(parts)
+
+    def to_dict(self):
+        return {direction: self.total[direction].to_dict() for direction in DIRECTIONS}
@@ -0,0 +1,75 @@
+import threading
+from array import array
+
+class InflightTable:
+    # Matches echoes to sends in a ring indexed by seq % window. A packet still unanswered
+    # when its slot is reused (a full window of later sends) counts as lost. An echo that
+    # shows up after that counts as late, a second echo for the same seq as a duplicate, and
+    # an echo older than the newest one already matched as reordered. Memory is fixed by window.
+    def __init__(self, window=65536):
+        self.window = window
+        self.seqs = array('q', [0]) * window  # 0 marks an empty slot, seqs start at 1
+        self.acked = bytearray(window)
+        self.lock = threading.Lock()
+        self.sent = 0
+        self.received = 0
+        self.lost = 0
+        self.late = 0
+        self.duplicates = 0
+        self.reordered = 0
+        self.unexpected = 0
+        self.highest_acked = 0
+
+    def register(self, seq):
+        slot = seq % self.window
+        with self.lock:
+            if self.seqs[slot] and not self.acked[slot]:
+                self.lost += 1
+            self.seqs[slot] = seq
+            self.acked[slot] = 0
+            self.sent += 1
+
+    def acknowledge(self, seq):
+        slot = seq % self.window
+        with self.lock:
+            current = self.seqs[slot]
+            if current != seq:
+                if 0 < seq < current:
+                    self.late += 1
+                else:
+                    self.unexpected += 1
+                return
+            if self.acked[slot]:
+                self.duplicates += 1
+                return
+            self.acked[slot] = 1
+            self.received += 1
+            if seq < self.highest_acked:
+                self.reordered += 1
+            else:
+                self.highest_acked = seq
+
+    def finalize(self):
+        # Whatever is still unanswered at the end of the run is lost
+        with self.lock:
+            for slot in range(self.window):
+                if self.seqs[slot] and not self.acked[slot]:
+                    self.lost += 1
+                    self.acked[slot] = 1
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "sent": self.sent,
+                "received": self.received,
+                "lost": self.lost,
+                "late": self.late,
+                "duplicates": self.duplicates,
+                "reordered": self.reordered,
+                "unexpected": self.unexpected,
+            }
+
+    def summary(self):
+        s = self.snapshot()
+        return (f"received {s['received']} lost {s['lost']} late {s['late']} "
+                f"dup {s['duplicates']} reordered {s['reordered']}")
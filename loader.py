@@ -0,0 +1,167 @@
+import os
+import re
+import glob
+
+import numpy as np
+import pandas as pd
+
+import columnar
+
+# Typed NumPy arrays for client series, processed series and packet logs. Parsed text files
+# are cached as .npz next to them (in a .cache directory), keyed by the source path, size and
+# mtime, so loading the same series again skips the text parsing altogether.
+input_folder = "results_client"
+
+CACHE_VERSION = 2  # bumped when a parser changes what it returns, older caches are parsed again
+
+RAW_COLUMNS = ('seq', 't_client_send', 't_server_recv', 't_client_recv')
+SERVER_COLUMNS = ('seq', 't_client_send', 't_server_recv', 't_server_user')
+PROCESSED_COLUMNS = ('sequence', 'sent_at', 'response_at', 'sender_to_receiver', 'receiver_to_sender')
+
+def parse_csv(source, nrows=None, sep=','):
+    # seq, t_client_send, payload, t_server_recv, t_client_recv[, extra]: skip the payload and extras.
+    # source is a path or a file-like object holding complete lines
+    usecols = [0, 1, 3, 4]
+    try:
+        frame = pd.read_csv(source, sep=sep, header=None, usecols=usecols, dtype=np.int64, nrows=nrows)
+    except pd.errors.EmptyDataError:
+        return {name: np.empty(0, dtype=np.int64) for name in RAW_COLUMNS}
+    except ValueError:
+        # Header or malformed lines: read as text and keep only the fully numeric rows
+        if hasattr(source, 'seek'):
+            source.seek(0)
+        frame = pd.read_csv(source, sep=sep, header=None, usecols=usecols, dtype=str, nrows=nrows,
+                            on_bad_lines='skip')
+        numeric = np.ones(len(frame), dtype=bool)
+        for column in usecols:
+            numeric &= frame[column].str.fullmatch(r'\d+', na=False).to_numpy()
+        frame = frame[numeric].astype(np.int64)
+    return {name: frame[column].to_numpy() for name, column in zip(RAW_COLUMNS, usecols)}
+
+def is_server_log(path):
+    # Server packets_*.psv (and worker/session shards) sit next to server_config.json. Their
+    # fifth field, with --kernel-timestamps, is the server's userspace time, not t_client_recv
+    directory, name = os.path.split(os.path.abspath(path))
+    return name.startswith('packets_') or os.path.exists(os.path.join(directory, 'server_config.json'))
+
+def psv_columns(path):
+    # (names, column indices) of a pipe separated packet log
+    with open(path, 'r') as f:
+        fields = f.readline().count('|') + 1
+    if is_server_log(path):
+        if fields >= 5:
+            return SERVER_COLUMNS, [0, 1, 3, 4]
+        return SERVER_COLUMNS[:3], [0, 1, 3]
+    if fields >= 5:
+        return RAW_COLUMNS, [0, 1, 3, 4]
+    return RAW_COLUMNS[:3], [0, 1, 3]
+
+def parse_psv(path):
+    # Pipe separated packet logs: client seq|t_client_send|payload|t_server_recv|t_client_recv,
+    # server seq|t_client_send|payload|t_server_recv[|t_server_user]
+    names, usecols = psv_columns(path)
+    if names is RAW_COLUMNS:
+        return parse_csv(path, sep='|')
+    frame = pd.read_csv(path, sep='|', header=None, usecols=usecols, dtype=np.int64)
+    return {name: frame[column].to_numpy() for name, column in zip(names, usecols)}
+
+def parse_processed(path):
+    frame = pd.read_csv(path)
+    data = {name: frame[name].to_numpy(dtype=np.float64) for name in PROCESSED_COLUMNS}
+    data['sequence'] = frame['sequence'].to_numpy(dtype=np.int64)
+    return data
+
+def cache_path(path):
+    directory, name = os.path.split(os.path.abspath(path))
+    return os.path.join(directory, '.cache', name + '.npz')
+
+def cached(path, parse):
+    # Returns parse(path), from the .npz cache when it matches the source's size and mtime
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns, CACHE_VERSION)
+    cache_file = cache_path(path)
+    if os.path.exists(cache_file):
+        try:
+            with np.load(cache_file) as cache:
+                if (str(cache['_path']), int(cache['_size']), int(cache['_mtime_ns']),
+                        int(cache['_version'])) == key:
+                    return {name: cache[name] for name in cache.files if not name.startswith('_')}
+        except (OSError, ValueError, KeyError):
+            pass  # unreadable or old cache, parse again
+
+    data = parse(path)
+    os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+    tmp_file = f"{cache_file}.{os.getpid()}.tmp.npz"  # workers may parse the same file at once
+    np.savez(tmp_file, _path=key[0], _size=key[1], _mtime_ns=key[2], _version=key[3], **data)
+    os.replace(tmp_file, cache_file)
+    return data
+
+def read_series(exp_dir, series_number, nrows=None):
+    # {column: int64 array} from series_N.csv, or from the columnar chunks when there is no CSV.
+    # Uncached, for files that are still growing
+    input_file_path = os.path.join(exp_dir, f"series_{series_number}.csv")
+    if not os.path.exists(input_file_path) and os.path.exists(os.path.join(exp_dir, f"series_{series_number}.json")):
+        columns = columnar.load_series(exp_dir, series_number)
+        return {name: np.asarray(columns[name][:nrows]) for name in RAW_COLUMNS}
+
+    return parse_csv(input_file_path, nrows)
+
+def series_numbers(exp_dir):
+    # CSV series plus columnar ones, ignoring the *_processed.csv outputs
+    numbers = set(columnar.series_numbers(exp_dir))
+    for path in glob.glob(os.path.join(exp_dir, "series_*.csv")):
+        match = re.search(r'series_(\d+)\.csv$', path)
+        if match:
+            numbers.add(int(match.group(1)))
+    return sorted(numbers)
+
+def exp_path(exp_number):
+    return os.path.join(input_folder, f"exp_{exp_number}")
+
+def load_file(path):
+    # Any series or packet file by name: *_processed.csv, raw series .csv or .psv packet logs
+    if path.endswith('_processed.csv'):
+        return cached(path, parse_processed)
+    if path.endswith('.psv'):
+        return cached(path, parse_psv)
+    return cached(path, parse_csv)
+
+def iter_file(path, chunk_rows=1_000_000):
+    # Raw columns of a series .csv or a .psv log (same columns as parse_psv), chunk_rows rows
+    # at a time, for traces too long to hold in memory at once. Bypasses the cache
+    sep = '|' if path.endswith('.psv') else ','
+    names, usecols = psv_columns(path) if sep == '|' else (RAW_COLUMNS, [0, 1, 3, 4])
+    with open(path, 'r') as f:
+        first = f.readline()
+    skiprows = 0 if first[:1].isdigit() else 1  # header line
+    reader = pd.read_csv(path, sep=sep, header=None, usecols=usecols, dtype=np.int64,
+                         skiprows=skiprows, chunksize=chunk_rows)
+    for frame in reader:
+        yield {name: frame[column].to_numpy() for name, column in zip(names, usecols)}
+
+def load_raw(exp_number, series_number):
+    # seq and the three timestamps (int64 ns) of a client series, CSV or columnar
+    exp_dir = exp_path(exp_number)
+    input_file_path = os.path.join(exp_dir, f"series_{series_number}.csv")
+    if not os.path.exists(input_file_path):
+        return read_series(exp_dir, series_number)
+    return cached(input_file_path, parse_csv)
+
+def load_processed(exp_number, series_number):
+    # Relative send/response times and one-way latencies (ms) written by process.py
+    return cached(os.path.join(exp_path(exp_number), f"series_{series_number}_processed.csv"), parse_processed)
+
+def load_experiment(exp_number, processed=True):
+    # All series of an experiment concatenated in series order
+    exp_dir = exp_path(exp_number)
+    if processed:
+        paths = glob.glob(os.path.join(exp_dir, "series_*_processed.csv"))
+        numbers = sorted(int(re.search(r'series_(\d+)_processed\.csv$', path).group(1)) for path in paths)
+        parts = [load_processed(exp_number, n) for n in numbers]
+        columns = PROCESSED_COLUMNS
+    else:
+        parts = [load_raw(exp_number, n) for n in series_numbers(exp_dir)]
+        columns = RAW_COLUMNS
+    if not parts:
+        raise FileNotFoundError(f"No series found in {exp_dir}")
+    return {name: np.concatenate([part[name] for part in parts]) for name in columns}
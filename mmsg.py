@@ -0,0 +1,205 @@
+import sys
+import errno
+import ctypes
+import ctypes.util
+import socket
+import struct
+import time
+
+import timestamps
+
+# recvmmsg(2) / sendmmsg(2) through ctypes: one syscall moves a whole batch of datagrams.
+# Linux only; available() is False elsewhere and callers keep the per-packet path.
+# Buffers, addresses and control data are preallocated once per socket.
+
+class iovec(ctypes.Structure):
+    _fields_ = [('iov_base', ctypes.c_void_p), ('iov_len', ctypes.c_size_t)]
+
+class msghdr(ctypes.Structure):
+    _fields_ = [
+        ('msg_name', ctypes.c_void_p),
+        ('msg_namelen', ctypes.c_uint32),
+        ('msg_iov', ctypes.POINTER(iovec)),
+        ('msg_iovlen', ctypes.c_size_t),
+        ('msg_control', ctypes.c_void_p),
+        ('msg_controllen', ctypes.c_size_t),
+        ('msg_flags', ctypes.c_int),
+    ]
+
+class mmsghdr(ctypes.Structure):
+    _fields_ = [('msg_hdr', msghdr), ('msg_len', ctypes.c_uint)]
+
+MSG_WAITFORONE = 0x10000
+SOCKADDR_SIZE = 128  # sizeof(struct sockaddr_storage)
+CMSGHDR = struct.Struct('@Nii')  # cmsg_len, cmsg_level, cmsg_type
+CMSG_ALIGN = ctypes.sizeof(ctypes.c_size_t)
+MMSGHDR_SIZE = ctypes.sizeof(mmsghdr)
+
+try:
+    libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    _recvmmsg = libc.recvmmsg
+    _sendmmsg = libc.sendmmsg
+except (OSError, AttributeError, TypeError):
+    libc = None
+else:
+    _recvmmsg.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int, ctypes.c_void_p]
+    _recvmmsg.restype = ctypes.c_int
+    _sendmmsg.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int]
+    _sendmmsg.restype = ctypes.c_int
+
+def available():
+    return libc is not None and sys.platform.startswith('linux')
+
+def align(length):
+    return (length + CMSG_ALIGN - 1) & ~(CMSG_ALIGN - 1)
+
+def encode_address(host, port):
+    # sockaddr_in6 for an AF_INET6 socket; IPv4 hosts become v4-mapped addresses
+    info = socket.getaddrinfo(host, port, socket.AF_INET6, socket.SOCK_DGRAM, 0, socket.AI_V4MAPPED)
+    host, port, flowinfo, scope_id = info[0][4]
+    return (struct.pack('@H', socket.AF_INET6) + struct.pack('!HI', port, flowinfo)
+            + socket.inet_pton(socket.AF_INET6, host) + struct.pack('@I', scope_id))
+
+def decode_address(raw):
+    # Same tuples as recvfrom: (host, port, flowinfo, scope_id) for IPv6, (host, port) for IPv4
+    family = struct.unpack_from('@H', raw)[0]
+    port = struct.unpack_from('!H', raw, 2)[0]
+    if family == socket.AF_INET6:
+        flowinfo = struct.unpack_from('!I', raw, 4)[0]
+        scope_id = struct.unpack_from('@I', raw, 24)[0]
+        return socket.inet_ntop(socket.AF_INET6, raw[8:24]), port, flowinfo, scope_id
+    return socket.inet_ntop(socket.AF_INET, raw[4:8]), port
+
+class Batch:
+    def __init__(self, sock, batch, bufsize, control_size=0):
+        self.fd = sock.fileno()
+        self.batch = batch
+        self.bufsize = bufsize
+        self.control_size = control_size
+        self.data = ctypes.create_string_buffer(batch * bufsize)
+        self.view = memoryview(self.data).cast('B')
+        self.buffers = [self.view[i * bufsize:(i + 1) * bufsize] for i in range(batch)]
+        self.names = ctypes.create_string_buffer(batch * SOCKADDR_SIZE)
+        self.controls = ctypes.create_string_buffer(max(1, batch * control_size))
+        self.iov = (iovec * batch)()
+        self.msgs = (mmsghdr * batch)()
+        self.msgs_address = ctypes.addressof(self.msgs)
+
+        base = ctypes.addressof(self.data)
+        for i in range(batch):
+            self.iov[i].iov_base = base + i * bufsize
+            self.iov[i].iov_len = bufsize
+            hdr = self.msgs[i].msg_hdr
+            hdr.msg_iov = ctypes.pointer(self.iov[i])
+            hdr.msg_iovlen = 1
+
+    def set_length(self, i, nbytes):
+        self.iov[i].iov_len = nbytes
+
+    def send(self, start, stop):
+        # sendmmsg may stop short (e.g. a full socket buffer), keep going until the range is out
+        while start < stop:
+            sent = _sendmmsg(self.fd, self.msgs_address + start * MMSGHDR_SIZE, stop - start, 0)
+            if sent < 0:
+                err = ctypes.get_errno()
+                if err == errno.EINTR:
+                    continue
+                raise OSError(err, f"sendmmsg: {errno.errorcode.get(err, err)}")
+            start += sent
+
+class BatchReceiver(Batch):
+    # Receives up to `batch` datagrams per recvmmsg and can echo them back in place with
+    # sendmmsg to their source addresses. All datagrams of a batch share one userspace
+    # wakeup, so SO_TIMESTAMPNS is always requested to keep a receive time per packet.
+    def __init__(self, sock, batch=64, bufsize=2048, headroom=0):
+        super().__init__(sock, batch, bufsize + headroom, timestamps.ANCBUFSIZE)
+        self.recv_size = bufsize
+        self.kernel_timestamps = timestamps.enable(sock)
+        self.user_time = 0
+        self.count = 0
+        self.addresses = {}
+
+        self.names_address = ctypes.addressof(self.names)
+        self.controls_address = ctypes.addressof(self.controls)
+        for i in range(batch):
+            hdr = self.msgs[i].msg_hdr
+            hdr.msg_name = self.names_address + i * SOCKADDR_SIZE
+            if self.control_size:
+                hdr.msg_control = self.controls_address + i * self.control_size
+        self.reset(batch)
+
+    def reset(self, count):
+        for i in range(count):
+            hdr = self.msgs[i].msg_hdr
+            hdr.msg_namelen = SOCKADDR_SIZE
+            hdr.msg_controllen = self.control_size
+            hdr.msg_flags = 0
+            self.iov[i].iov_len = self.recv_size
+
+    def recv(self):
+        # Blocks for the first datagram, then takes whatever else is already queued.
+        # Returns the number of datagrams, 0 when interrupted by a signal
+        self.reset(self.count)
+        self.count = 0
+        n = _recvmmsg(self.fd, self.msgs_address, self.batch, MSG_WAITFORONE, None)
+        self.user_time = time.time_ns()
+        if n < 0:
+            err = ctypes.get_errno()
+            if err == errno.EINTR:
+                return 0
+            raise OSError(err, f"recvmmsg: {errno.errorcode.get(err, err)}")
+        # Echoes go out with the received lengths unless set_length() changes them
+        for i in range(n):
+            self.iov[i].iov_len = min(self.msgs[i].msg_len, self.recv_size)
+        self.count = n
+        return n
+
+    def length(self, i):
+        return self.iov[i].iov_len
+
+    def address(self, i):
+        raw = ctypes.string_at(self.names_address + i * SOCKADDR_SIZE, self.msgs[i].msg_hdr.msg_namelen)
+        addr = self.addresses.get(raw)
+        if addr is None:
+            addr = self.addresses[raw] = decode_address(raw)
+        return addr
+
+    def kernel_time(self, i):
+        # SCM_TIMESTAMPNS of datagram i, or None
+        length = self.msgs[i].msg_hdr.msg_controllen
+        if not length:
+            return None
+        control = ctypes.string_at(self.controls_address + i * self.control_size, length)
+        offset = 0
+        while offset + CMSGHDR.size <= length:
+            cmsg_len, level, kind = CMSGHDR.unpack_from(control, offset)
+            if cmsg_len < CMSGHDR.size:
+                break
+            if level == socket.SOL_SOCKET and kind == timestamps.SCM_TIMESTAMPNS:
+                sec, nsec = timestamps.TIMESPEC.unpack_from(control, offset + align(CMSGHDR.size))
+                return sec * 1_000_000_000 + nsec
+            offset += align(cmsg_len)
+        return None
+
+    def send(self, start, stop):
+        # Echo datagrams [start, stop) to where they came from, without the received control data
+        for i in range(start, stop):
+            self.msgs[i].msg_hdr.msg_controllen = 0
+        super().send(start, stop)
+
+class BatchSender(Batch):
+    # Sends up to `batch` datagrams to one destination per sendmmsg
+    def __init__(self, sock, host, port, batch=64, bufsize=2048):
+        super().__init__(sock, batch, bufsize)
+        name = encode_address(host, port)
+        ctypes.memmove(self.names, name, len(name))
+        for i in range(batch):
+            hdr = self.msgs[i].msg_hdr
+            hdr.msg_name = ctypes.addressof(self.names)
+            hdr.msg_namelen = len(name)
+
+    def put(self, i, payload):
+        # Copies the payload, so a reused packet buffer can be rebuilt for the next slot
+        nbytes = len(payload)
+        self.buffers[i][:nbytes] = payload
+        self.iov[i].iov_len = nbytes
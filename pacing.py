@@ -0,0 +1,59 @@
+import time
+import random
+
+# fixed: t0 + k * interval, poisson: exponential gaps with the same mean,
+# uniform: interval +/- jitter. Deadlines are absolute, so per-packet work never accumulates as drift.
+PACING_MODES = ('fixed', 'poisson', 'uniform')
+
+class Pacer:
+    def __init__(self, interval, mode='fixed', jitter=0.0, spin=0.0002, seed=None):
+        if mode not in PACING_MODES:
+            raise ValueError(f"mode must be one of {PACING_MODES}")
+        self.interval_ns = int(interval * 1e9)
+        self.mode = mode
+        self.jitter_ns = int(jitter * 1e9)
+        self.spin_ns = int(spin * 1e9)
+        self.rng = random.Random(seed)
+        self.t0 = None
+        self.count = 0
+        self.deadline = None
+
+    def start(self):
+        self.t0 = time.perf_counter_ns()
+        self.count = 0
+        self.deadline = self.t0
+
+    def advance(self):
+        self.count += 1
+        if self.mode == 'fixed':
+            self.deadline = self.t0 + self.count * self.interval_ns
+        elif self.mode == 'poisson':
+            self.deadline += int(self.rng.expovariate(1 / self.interval_ns))
+        else:
+            self.deadline += self.interval_ns + int(self.rng.uniform(-self.jitter_ns, self.jitter_ns))
+
+    def remaining_ns(self):
+        return self.deadline - time.perf_counter_ns()
+
+    def wait(self):
+        # Coarse sleep until shortly before the deadline, then spin. sleep(0) releases the
+        # GIL so the listener thread is not held off while spinning. Returns the lateness in ns.
+        remaining = self.remaining_ns()
+        if remaining > self.spin_ns:
+            time.sleep((remaining - self.spin_ns) / 1e9)
+        while time.perf_counter_ns() < self.deadline:
+            time.sleep(0)
+        return time.perf_counter_ns() - self.deadline
+
+def lateness_summary(lateness_ns):
+    # Mean / p50 / p99 / max send lateness in microseconds
+    if not lateness_ns:
+        return {}
+    ordered = sorted(lateness_ns)
+    n = len(ordered)
+    return {
+        "mean_us": sum(ordered) / n / 1e3,
+        "p50_us": ordered[n // 2] / 1e3,
+        "p99_us": ordered[min(n - 1, int(n * 0.99))] / 1e3,
+        "max_us": ordered[-1] / 1e3,
+    }
@@ -1,47 +1,156 @@
+import os
 import sys
+import argparse
 import numpy as np
 import matplotlib.pyplot as plt
+from scipy.signal import get_window
+import loader
+
+DIRECTIONS = ('uplink', 'downlink')
+
+class StreamingSpectrum:
+    # Welch PSD and STFT spectrogram of an irregularly sampled signal fed in time order, chunk
+    # by chunk. Samples are interpolated onto a regular fs grid and only the current segment
+    # (plus the last raw sample, to bridge chunks) is kept, so memory does not grow with the trace
+    def __init__(self, fs, segment_s, overlap=0.5, fmax=None):
+        self.fs = fs
+        self.nperseg = int(round(segment_s * fs))
+        self.step = max(1, int(round(self.nperseg * (1 - overlap))))
+        self.window = get_window('hann', self.nperseg)
+        self.scale = 1.0 / (fs * np.sum(self.window ** 2))
+        self.freqs = np.fft.rfftfreq(self.nperseg, 1 / fs)
+        self.keep = self.freqs <= fmax if fmax else np.ones(len(self.freqs), dtype=bool)
+        self.buffer = np.empty(0)
+        self.buffer_start = None
+        self.t_start = None
+        self.resampled = 0
+        self.last = None
+        self.psd_sum = np.zeros(len(self.freqs))
+        self.segments = 0
+        self.rows = []
+        self.times = []
+
+    def feed(self, t, y):
+        order = np.argsort(t, kind='stable')
+        t, y = t[order], y[order]
+        if self.last is not None:
+            # Reordered samples older than what was already resampled are dropped
+            later = t > self.last[0]
+            t = np.concatenate(([self.last[0]], t[later]))
+            y = np.concatenate(([self.last[1]], y[later]))
+        if len(t) == 0:
+            return
+        self.last = (t[-1], y[-1])
+        if self.t_start is None:
+            self.t_start = self.buffer_start = t[0]
+        # Grid points are indexed from the start so chunk boundaries do not accumulate rounding
+        total = int(np.floor((t[-1] - self.t_start) * self.fs + 1e-6)) + 1
+        if total <= self.resampled:
+            return
+        grid = self.t_start + np.arange(self.resampled, total) / self.fs
+        self.resampled = total
+        self.buffer = np.concatenate((self.buffer, np.interp(grid, t, y)))
+        self.flush()
+
+    def flush(self):
+        while len(self.buffer) >= self.nperseg:
+            segment = self.buffer[:self.nperseg]
+            spectrum = np.abs(np.fft.rfft((segment - segment.mean()) * self.window)) ** 2 * self.scale
+            # One-sided density: double everything but DC (and Nyquist for even lengths)
+            spectrum[1:len(spectrum) - (self.nperseg % 2 == 0)] *= 2
+            self.psd_sum += spectrum
+            self.segments += 1
+            self.rows.append(spectrum[self.keep].astype(np.float32))
+            self.times.append(self.buffer_start + self.nperseg / 2 / self.fs)
+            self.buffer = self.buffer[self.step:]
+            self.buffer_start += self.step / self.fs
+
+    def welch(self):
+        return self.psd_sum / max(self.segments, 1)
+
+    def spectrogram(self):
+        if not self.rows:
+            return np.empty((0, int(self.keep.sum())), dtype=np.float32)
+        return np.vstack(self.rows)
+
+def stream_spectra(filenames, segment_s=120.0, overlap=0.5, fs=None, fmax=1.0, chunk_rows=1_000_000):
+    # Uplink on the send time axis and downlink on the server time axis, as in the FFT plot,
+    # over one or more consecutive client files
+    spectra = None
+    t_send_0 = t_server_0 = None
+    for filename in filenames:
+        for chunk in loader.iter_file(filename, chunk_rows):
+            if 't_client_recv' not in chunk:
+                sys.exit(f"{filename} has no client receive timestamps")
+            t_send = chunk["t_client_send"]
+            t_server = chunk["t_server_recv"]
+            t_recv = chunk["t_client_recv"]
+            if spectra is None:
+                if len(t_send) < 2:
+                    continue
+                t_send_0, t_server_0 = t_send[0], t_server[0]
+                # Default rate: the median packet rate of the first chunk
+                rate = fs or 1e9 / np.median(np.diff(np.sort(t_send)))
+                spectra = {d: StreamingSpectrum(rate, segment_s, overlap, fmax) for d in DIRECTIONS}
+            spectra['uplink'].feed((t_send - t_send_0) / 1e9, (t_server - t_send) / 1e6)  # ms
+            spectra['downlink'].feed((t_server - t_server_0) / 1e9, (t_recv - t_server) / 1e6)
+    return spectra
+
+def welch_mode(args):
+    filenames = args.filenames
+    spectra = stream_spectra(filenames, args.segment, args.overlap, args.fs, args.fmax, args.chunk_rows)
+    if spectra is None or not spectra['uplink'].segments:
+        sys.exit(f"Trace shorter than one {args.segment:g} s segment")
+
+    uplink = spectra['uplink']
+    output = args.output or os.path.splitext(filenames[0])[0] + "_spectrum.npz"
+    results = {"freqs": uplink.freqs, "spectrogram_freqs": uplink.freqs[uplink.keep], "fs": uplink.fs,
+               "segment_s": args.segment, "overlap": args.overlap}
+    for direction, spectrum in spectra.items():
+        results[f"welch_{direction}"] = spectrum.welch()
+        results[f"spectrogram_{direction}"] = spectrum.spectrogram()
+        results[f"times_{direction}"] = np.array(spectrum.times)
+    np.savez(output, **results)
+    print(f"{uplink.segments} segments of {args.segment:g} s at {uplink.fs:.1f} Hz, saved to {output}")
+
+    plt.figure(figsize=(12, 8))
+    plt.subplot(2, 2, 1)
+    for direction, color in zip(DIRECTIONS, ('tab:blue', 'tab:orange')):
+        plt.semilogy(results["freqs"], results[f"welch_{direction}"], label=direction, color=color, linewidth=1)
+    plt.xlim(0, args.fmax)
+    plt.xlabel("Frequency [Hz]")
+    plt.ylabel("PSD [ms²/Hz]")
+    plt.title("Welch PSD")
+    plt.legend()
+    plt.grid(True, linestyle='--', alpha=0.5)
+    [plt.axvline(i/15, color='darkblue', linestyle='--', linewidth=2, alpha=0.15) for i in range(1, 6)]
 
-def main():
-    if len(sys.argv) > 1:
-        filename = sys.argv[1]
-    else:
-        filename = input("Enter filename: ")
-
-    time_1 = []
-    time_2 = []
-    signal_1 = []
-    signal_2 = []
-
-    experiment_starts_at = 0
-    with open(filename, 'r') as f:
-        lines = f.readlines()
-        if len(lines) > 0:
-            experiment_starts_at = float(lines[0].split('|')[1])
-        for line in lines:
-            line = line.strip()
-            if not line or line.startswith('sequence'):
-                continue
-            parts = line.split('|')
-            if len(parts) < 5:
-                continue
-            t = (float(parts[1]) - experiment_starts_at) / 1e9  # ns -> s
-            time_1.append(t)
-
-            t = (float(parts[3]) - float(lines[0].split('|')[3])) / 1e9  # ns -> s
-            time_2.append(t)
-
-            # signal_1:
-            end_timestamp = float(parts[3])
-            start_timestamp = float(parts[1])
-            y = (end_timestamp - start_timestamp) / 1e9  # ns -> s
-            signal_1.append(y)
-
-            # signal_2:
-            end_timestamp = float(parts[4])
-            start_timestamp = float(parts[3])
-            y = (end_timestamp - start_timestamp) / 1e9  # ns -> s
-            signal_2.append(y)
+    for position, direction in zip((3, 4), DIRECTIONS):
+        plt.subplot(2, 2, position)
+        times = results[f"times_{direction}"]
+        plt.pcolormesh(times, results["spectrogram_freqs"], 10 * np.log10(results[f"spectrogram_{direction}"].T + 1e-12),
+                       shading='nearest')
+        plt.colorbar(label='dB')
+        plt.xlabel("Time [s]")
+        plt.ylabel("Frequency [Hz]")
+        plt.title(f"Spectrogram {direction}")
+    plt.tight_layout()
+    plt.savefig(os.path.splitext(output)[0] + ".png")
+    plt.show()
+
+def render(filename, show=True):
+    # Client packet log (.psv) or series (.csv) with all four timestamps
+    data = loader.load_file(filename)
+    if 't_client_recv' not in data:
+        sys.exit(f"{filename} has no client receive timestamps")
+    t_send = data["t_client_send"]
+    t_server = data["t_server_recv"]
+    t_recv = data["t_client_recv"]
+
+    time_1 = (t_send - t_send[0]) / 1e9  # ns -> s
+    time_2 = (t_server - t_server[0]) / 1e9  # ns -> s
+    signal_1 = (t_server - t_send) / 1e9  # uplink, ns -> s
+    signal_2 = (t_recv - t_server) / 1e9  # downlink, ns -> s
 
     # FFT UPLINK
 
@@ -95,7 +204,32 @@ def main():
     plt.grid(True, linestyle='--', alpha=0.5)
     [plt.axvline(i/15, color='darkblue', linestyle='--', linewidth=2, alpha=0.15) for i in range(1, 6)]
     plt.tight_layout()
-    plt.show()
+    fig_path = os.path.splitext(filename)[0] + "_fft.png"
+    plt.savefig(fig_path)
+    if show:
+        plt.show()
+    plt.close()
+    return [fig_path]
+
+def main():
+    parser = argparse.ArgumentParser(description="Latency spectrum of a client packet log or series")
+    parser.add_argument('filenames', nargs='*', help='Client .psv log or series .csv (several consecutive files with --welch)')
+    parser.add_argument('--welch', action='store_true',
+                        help='Streaming Welch PSD and spectrogram in overlapping segments, with bounded memory')
+    parser.add_argument('--segment', type=float, default=120.0, help='Segment length in seconds (--welch)')
+    parser.add_argument('--overlap', type=float, default=0.5, help='Segment overlap fraction (--welch)')
+    parser.add_argument('--fs', type=float, help='Resampling rate in Hz (--welch, default: the packet rate)')
+    parser.add_argument('--fmax', type=float, default=1.0, help='Highest frequency kept in the spectrogram (Hz)')
+    parser.add_argument('--chunk-rows', type=int, default=1_000_000, help='Rows read per chunk (--welch)')
+    parser.add_argument('--output', help='Results file (--welch, default <file>_spectrum.npz)')
+    args = parser.parse_args()
+
+    if not args.filenames:
+        args.filenames = [input("Enter filename: ")]
+    if args.welch:
+        welch_mode(args)
+        return
+    render(args.filenames[0])
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,58 +1,56 @@
-import sys
 import os
-import matplotlib.pyplot as plt
+import argparse
+import numpy as np
+import loader
 
-def main():
+input_folder = "results_client"
 
-    input_folder = "results_client"
+FIGSIZE = (10, 6)
+DPI = 100
 
-    series_number = "1"
-    if len(sys.argv) == 2:
-        exp_number = sys.argv[1]
-    elif len(sys.argv) == 3:
-        exp_number = sys.argv[1]
-        series_number = sys.argv[2]
-    else:
-        exp_number = input("Enter experiment number: ").strip()
-        series_number = input("Enter series number: ").strip()
+def decimate_minmax(x, y, bins):
+    # Keeps the min and max sample of every x bin (one bin per pixel column), in their original
+    # order. Spikes survive and the number of drawn points depends on the figure width only
+    if len(x) <= 2 * bins:
+        return x, y
+    x_min, x_max = np.min(x), np.max(x)
+    if x_max == x_min:
+        return x[[np.argmin(y), np.argmax(y)]], y[[np.argmin(y), np.argmax(y)]]
+    column = np.minimum(((x - x_min) / (x_max - x_min) * bins).astype(np.int64), bins - 1)
+    order = np.lexsort((y, column))  # by column, then by value within the column
+    sorted_columns = column[order]
+    first = np.flatnonzero(np.r_[True, sorted_columns[1:] != sorted_columns[:-1]])
+    last = np.r_[first[1:] - 1, len(order) - 1]
+    keep = np.unique(np.concatenate((order[first], order[last])))
+    return x[keep], y[keep]
 
-    filename = f"series_{series_number}_processed.csv"
-    processed_filename = os.path.join(input_folder, "exp_" + exp_number , filename)
+def render(exp_number, series_number, show=True, max_points=None):
+    import matplotlib.pyplot as plt
 
-    sequence = []
-    sender_sent_at_relative = []
-    receiver_sent_at_relative = []
-    sender_to_receiver = []
-    receiver_to_sender = []
-    rtt = []
+    data = loader.load_processed(exp_number, series_number)
+    sequence = data["sequence"]
+    sender_sent_at_relative = data["sent_at"] * 1e-3
+    receiver_sent_at_relative = data["response_at"] * 1e-3
+    sender_to_receiver = data["sender_to_receiver"]
+    receiver_to_sender = data["receiver_to_sender"]
+    rtt = sender_to_receiver + receiver_to_sender
 
-    experiment_starts_at = 0
-
-    with open(processed_filename, 'r') as f:
-
-        for line in f:
-            line = line.strip()
-            if not line or line.startswith('sequence'):
-                continue  # skip header or empty lines
-            parts = line.split(',')
-            if len(parts) < 3:
-                continue  # skip malformed lines
-
-            sequence.append(int(parts[0]))
-            sender_sent_at_relative.append(float(parts[1]) * 1e-3)
-            receiver_sent_at_relative.append(float(parts[2]) * 1e-3)
-            sender_to_receiver.append(float(parts[3]))
-            receiver_to_sender.append(float(parts[4]))
-            rtt.append(float(parts[3]) + float(parts[4]))
+    # Min/max per pixel column by default; max_points=0 draws every sample
+    bins = FIGSIZE[0] * DPI if max_points is None else max_points // 2
+    if bins:
+        decimate = lambda x, y: decimate_minmax(x, y, bins)
+    else:
+        decimate = lambda x, y: (x, y)
 
     # Prepare directory for saving figures and stats
     stats_dir = os.path.join(input_folder, f"exp_{exp_number}")
     os.makedirs(stats_dir, exist_ok=True)
+    fig_paths = []
 
-    plt.figure(figsize=(10, 6))
-    plt.plot(sender_sent_at_relative, sender_to_receiver, label='Lab -> SL -> Server', alpha=0.5, marker='o', markersize=2)
-    plt.plot(receiver_sent_at_relative, receiver_to_sender, label='Server -> SL -> Lab', alpha=0.5, marker='o', markersize=2)
-    plt.plot(sender_sent_at_relative, rtt, label='RTT', alpha=0.8, marker='o', markersize=2)
+    plt.figure(figsize=FIGSIZE, dpi=DPI)
+    plt.plot(*decimate(sender_sent_at_relative, sender_to_receiver), label='Lab -> SL -> Server', alpha=0.5, marker='o', markersize=2)
+    plt.plot(*decimate(receiver_sent_at_relative, receiver_to_sender), label='Server -> SL -> Lab', alpha=0.5, marker='o', markersize=2)
+    plt.plot(*decimate(sender_sent_at_relative, rtt), label='RTT', alpha=0.8, marker='o', markersize=2)
     plt.xlabel('Time [s]')
     plt.ylabel('Latency [ms]')
     plt.title('Processed Latency Data')
@@ -61,10 +59,13 @@ def main():
     plt.tight_layout()
     fig_path = os.path.join(stats_dir, f"processed_latency_data_{series_number}.png")
     plt.savefig(fig_path)
-    plt.show()
+    fig_paths.append(fig_path)
+    if show:
+        plt.show()
+    plt.close()
 
-    plt.figure(figsize=(10, 6))
-    plt.plot(sequence, rtt, label='RTT', alpha=0.8, marker='o', markersize=2)
+    plt.figure(figsize=FIGSIZE, dpi=DPI)
+    plt.plot(*decimate(sequence, rtt), label='RTT', alpha=0.8, marker='o', markersize=2)
     plt.xlabel('Sequence Number')
     plt.ylabel('RTT [ms]')
     plt.title('RTT vs Sequence Number')
@@ -73,7 +74,36 @@ def main():
     plt.tight_layout()
     fig_path = os.path.join(stats_dir, f"rtt_{series_number}.png")
     plt.savefig(fig_path)
-    plt.show()
+    fig_paths.append(fig_path)
+    if show:
+        plt.show()
+    plt.close()
+    return fig_paths
+
+def main():
+    parser = argparse.ArgumentParser(description="Plot processed latency time series")
+    parser.add_argument('exp_number', nargs='?', help='Experiment number')
+    parser.add_argument('series_number', nargs='?', help='Series number (default 1)')
+    parser.add_argument('--no-show', action='store_true',
+                        help='Only write the PNGs, on the non-interactive Agg backend')
+    parser.add_argument('--max-points', type=int,
+                        help='Points drawn per line after min/max decimation (default: 2 per pixel column, 0: all)')
+    args = parser.parse_args()
+
+    if args.no_show:
+        import matplotlib
+        matplotlib.use('Agg')
+
+    series_number = "1"
+    if args.exp_number is not None:
+        exp_number = args.exp_number
+        series_number = args.series_number or series_number
+    else:
+        exp_number = input("Enter experiment number: ").strip()
+        series_number = input("Enter series number: ").strip()
+
+    for fig_path in render(exp_number, series_number, show=not args.no_show, max_points=args.max_points):
+        print(f"Saved {fig_path}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
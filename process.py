@@ -1,70 +1,207 @@
 import os
+import io
 import sys
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import columnar
+from loader import RAW_COLUMNS, read_series, parse_csv, series_numbers
 
 input_folder = "results_client"
 
+def series_start(exp_dir, series_number):
+    # First send timestamp of a series, read from its first rows only
+    sent = read_series(exp_dir, series_number, nrows=100)['t_client_send']
+    return int(sent.min()) if len(sent) else None
+
+def to_processed(raw, experiment_starts_at):
+    start_ts = raw['t_client_send']
+    bounce_ts = raw['t_server_recv']
+    received_ts = raw['t_client_recv']
+    # Differences are taken in int64 before scaling, so no nanoseconds are lost to float rounding
+    return pd.DataFrame({
+        "sequence": raw['seq'],
+        "sent_at": (start_ts - experiment_starts_at) / 1e6,
+        "response_at": (bounce_ts - experiment_starts_at) / 1e6,
+        "sender_to_receiver": (bounce_ts - start_ts) / 1e6,
+        "receiver_to_sender": (received_ts - bounce_ts) / 1e6,
+    })
+
+def process_series(exp_dir, series_number, experiment_starts_at=None):
+    raw = read_series(exp_dir, series_number)
+    if experiment_starts_at is None:
+        experiment_starts_at = int(raw['t_client_send'][0]) if len(raw['t_client_send']) else 0
+        print(f"Experiment starts at: {experiment_starts_at}")
+
+    processed = to_processed(raw, experiment_starts_at)
+    processed_filename = os.path.join(exp_dir, f"series_{series_number}_processed.csv")
+    processed.to_csv(processed_filename, index=False)
+    # The output no longer matches an --incremental checkpoint, the next increment starts over
+    checkpoint = checkpoint_path(exp_dir, series_number)
+    if os.path.exists(checkpoint):
+        os.remove(checkpoint)
+    return processed_filename, len(processed)
+
 def process_file(exp_number, series_number):
-    
-    filename = "series_" + series_number
-
-    if not filename.endswith(".csv"):
-        filename += ".csv"
-        
-    input_file_path = os.path.join(input_folder, "exp_" + exp_number, filename)
-
-    processed_filename = os.path.join(
-        os.path.dirname(input_file_path),
-        f"series_{series_number}_processed.csv"
-    )
-
-    sequence = []
-    sender_relative_time = []
-    receiver_relative_time = []
-    sender_to_receiver_latency = []
-    receiver_to_sender_latency = []
-    experiment_starts_at = 0
-
-    with open(input_file_path, 'r') as f:
-        lines = f.readlines()
-        if len(lines) > 0:
-            experiment_starts_at = float(lines[0].split(',')[1])
-            print(f"Experiment starts at: {experiment_starts_at}")
-        f.seek(0)
-
-        for line in f:
-            line = line.strip()
-            if not line or line.startswith('sequence'):
-                continue
-            parts = line.split(',')
-            if len(parts) < 5:
+    exp_dir = os.path.join(input_folder, "exp_" + exp_number)
+    processed_filename, _ = process_series(exp_dir, series_number)
+    print(f"Processed file saved to {processed_filename}")
+
+def process_experiments(exp_numbers, workers=None):
+    # Every series of every experiment is one task. Times are relative to the first send of
+    # the whole experiment, so all of its series share the same time axis
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = []
+        for exp_number in exp_numbers:
+            exp_dir = os.path.join(input_folder, "exp_" + exp_number)
+            numbers = series_numbers(exp_dir)
+            if not numbers:
+                print(f"No series found in {exp_dir}")
                 continue
+            starts = [start for start in executor.map(series_start, [exp_dir] * len(numbers), numbers)
+                      if start is not None]
+            experiment_starts_at = min(starts, default=0)
+            print(f"exp_{exp_number}: {len(numbers)} series, experiment starts at: {experiment_starts_at}")
+            for series_number in numbers:
+                futures.append(executor.submit(process_series, exp_dir, series_number, experiment_starts_at))
 
-            seq = int(parts[0])
-            start_ts = float(parts[1])
-            bounce_ts = float(parts[3])
-            received_ts = float(parts[4])
+        total = 0
+        for future in futures:
+            processed_filename, rows = future.result()
+            total += rows
+            print(f"Processed file saved to {processed_filename} ({rows} packets)")
+        print(f"Processed {total} packets in {len(futures)} series")
 
-            sequence.append(seq)
-            sender_relative_time.append((start_ts - experiment_starts_at) / 1e6)
-            receiver_relative_time.append((bounce_ts - experiment_starts_at) / 1e6)
-            sender_to_receiver_latency.append((bounce_ts - start_ts) / 1e6)
-            receiver_to_sender_latency.append((received_ts - bounce_ts) / 1e6)
+def checkpoint_path(exp_dir, series_number):
+    return os.path.join(exp_dir, f"series_{series_number}.checkpoint.json")
 
-    with open(processed_filename, 'w') as f:
-        f.write("sequence,sent_at,response_at,sender_to_receiver,receiver_to_sender\n")
-        for seq, sent, res, bms, rmb in zip(sequence, sender_relative_time, receiver_relative_time, sender_to_receiver_latency, receiver_to_sender_latency):
-            f.write(f"{seq},{sent},{res},{bms},{rmb}\n")
+def read_new_rows(exp_dir, series_number, offset):
+    # Rows past the checkpoint offset: a byte offset for CSV series, a row count for columnar ones.
+    # Returns (raw columns, new offset); a trailing line still being written is left for next time
+    input_file_path = os.path.join(exp_dir, f"series_{series_number}.csv")
+    if not os.path.exists(input_file_path):
+        columns = columnar.load_series(exp_dir, series_number)
+        rows = min(len(columns[name]) for name in RAW_COLUMNS)
+        return {name: np.asarray(columns[name][offset:rows]) for name in RAW_COLUMNS}, rows
 
-    print(f"Processed file saved to {processed_filename}")
+    with open(input_file_path, 'rb') as f:
+        f.seek(offset)
+        chunk = f.read()
+    end = chunk.rfind(b'\n') + 1
+    return parse_csv(io.BytesIO(chunk[:end])), offset + end
+
+def line_before(path, end):
+    # The last line ending at byte `end`, which later appends leave untouched
+    with open(path, 'rb') as f:
+        f.seek(max(0, end - 4096))
+        data = f.read(end - f.tell())
+    return data[data.rstrip(b'\n').rfind(b'\n') + 1:].decode('utf-8', errors='replace')
+
+def process_increment(exp_dir, series_number, experiment_starts_at=None):
+    # Append only the rows added since the last call to series_N_processed.csv. The checkpoint
+    # records how far the source and the output got, so an interrupted append is rolled back.
+    # It also keeps the output's last line: if that changed, the output was rewritten since
+    processed_filename = os.path.join(exp_dir, f"series_{series_number}_processed.csv")
+    path = checkpoint_path(exp_dir, series_number)
+    checkpoint = None
+    if os.path.exists(path) and os.path.exists(processed_filename):
+        with open(path, 'r') as f:
+            checkpoint = json.load(f)
+        source = os.path.join(exp_dir, f"series_{series_number}.csv")
+        if os.path.exists(source) and os.path.getsize(source) < checkpoint["offset"]:
+            # The series was rewritten from scratch, start over
+            checkpoint = None
+        elif (os.path.getsize(processed_filename) < checkpoint["processed_bytes"]
+              or line_before(processed_filename, checkpoint["processed_bytes"]) != checkpoint.get("processed_tail")):
+            # series_N_processed.csv was rewritten by another mode, start over
+            checkpoint = None
+
+    fresh = checkpoint is None
+    if fresh:
+        checkpoint = {"offset": 0, "rows": 0, "processed_bytes": 0, "experiment_starts_at": experiment_starts_at}
+        with open(processed_filename, 'w') as f:
+            f.write("sequence,sent_at,response_at,sender_to_receiver,receiver_to_sender\n")
+        checkpoint["processed_bytes"] = os.path.getsize(processed_filename)
+    elif os.path.getsize(processed_filename) != checkpoint["processed_bytes"]:
+        with open(processed_filename, 'r+b') as f:
+            f.truncate(checkpoint["processed_bytes"])
+
+    raw, offset = read_new_rows(exp_dir, series_number, checkpoint["offset"])
+    if offset == checkpoint["offset"] and not fresh:
+        return 0
+
+    if checkpoint["experiment_starts_at"] is None and len(raw['t_client_send']):
+        checkpoint["experiment_starts_at"] = int(raw['t_client_send'][0])
+        print(f"Experiment starts at: {checkpoint['experiment_starts_at']}")
+    processed = to_processed(raw, checkpoint["experiment_starts_at"] or 0)
+    processed.to_csv(processed_filename, mode='a', header=False, index=False)
+
+    checkpoint["offset"] = offset
+    checkpoint["rows"] += len(processed)
+    checkpoint["processed_bytes"] = os.path.getsize(processed_filename)
+    checkpoint["processed_tail"] = line_before(processed_filename, checkpoint["processed_bytes"])
+    with open(path + ".tmp", 'w') as f:
+        json.dump(checkpoint, f)
+    os.replace(path + ".tmp", path)
+    return len(processed)
+
+def process_incremental(exp_numbers, follow=False, interval=2.0):
+    # Keeps up with growing series (and new ones after rotation) without reprocessing old rows
+    starts = {}
+    while True:
+        appended = 0
+        for exp_number in exp_numbers:
+            exp_dir = os.path.join(input_folder, "exp_" + exp_number)
+            numbers = series_numbers(exp_dir)
+            if starts.get(exp_number) is None and numbers:
+                starts[exp_number] = series_start(exp_dir, numbers[0])
+            for series_number in numbers:
+                rows = process_increment(exp_dir, series_number, starts.get(exp_number))
+                if rows:
+                    print(f"exp_{exp_number} series_{series_number}: +{rows} packets")
+                appended += rows
+        if not follow:
+            break
+        if not appended:
+            time.sleep(interval)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert client series to relative times and one-way latencies")
+    parser.add_argument('numbers', nargs='*',
+                        help='exp_number [series_number], or several exp_numbers with --all')
+    parser.add_argument('--all', action='store_true',
+                        help='Process every series of the given experiments in parallel')
+    parser.add_argument('--workers', type=int, help='Worker processes for --all (default: CPU count)')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Only parse rows added since the last run and append them to the processed files')
+    parser.add_argument('--follow', type=float, nargs='?', const=2.0, metavar='SECONDS',
+                        help='Keep processing new rows as they arrive, polling every SECONDS (default 2)')
+    args = parser.parse_args()
+
+    if args.incremental or args.follow is not None:
+        exp_numbers = args.numbers or input("Enter experiment numbers: ").split()
+        try:
+            process_incremental(exp_numbers, args.follow is not None, args.follow)
+        except KeyboardInterrupt:
+            pass
+        sys.exit(0)
+
+    if args.all:
+        exp_numbers = args.numbers or input("Enter experiment numbers: ").split()
+        process_experiments(exp_numbers, args.workers)
+        sys.exit(0)
+
     series_number = "1"
-    if len(sys.argv) == 2:
-        exp_number = sys.argv[1]
-    elif len(sys.argv) == 3:
-        exp_number = sys.argv[1]
-        series_number = sys.argv[2]
+    if len(args.numbers) == 1:
+        exp_number = args.numbers[0]
+    elif len(args.numbers) == 2:
+        exp_number, series_number = args.numbers
     else:
         exp_number = input("Enter experiment number: ").strip()
         series_number = input("Enter series number: ").strip()
-    process_file(exp_number, str(series_number))
\ No newline at end of file
+    process_file(exp_number, str(series_number))
@@ -0,0 +1,67 @@
+import os
+
+# never: leave it to the OS, batch: fsync after every flush, rotate: fsync when a file is closed
+FSYNC_POLICIES = ('never', 'batch', 'rotate')
+
+class RotatingWriter:
+    def __init__(self, directory, prefix, suffix, max_lines, fsync='never', skip_existing=False):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"fsync must be one of {FSYNC_POLICIES}")
+        self.directory = directory
+        self.prefix = prefix
+        self.suffix = suffix
+        self.max_lines = max_lines
+        self.fsync = fsync
+        self.file_counter = 1
+        self.line_count = 0
+        self.file = None
+
+        # Start after files left by an earlier run instead of appending to them
+        if skip_existing:
+            while os.path.exists(self.path()):
+                self.file_counter += 1
+
+    def path(self):
+        return os.path.join(self.directory, f'{self.prefix}{self.file_counter}{self.suffix}')
+
+    def open_current(self):
+        path = self.path()
+        self.line_count = 0
+        # Only a file we did not write ourselves is ever counted, and only once
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                self.line_count = sum(1 for _ in f)
+        self.file = open(path, 'a')
+
+    def close_current(self):
+        if self.file is None:
+            return
+        self.file.flush()
+        if self.fsync != 'never':
+            os.fsync(self.file.fileno())
+        self.file.close()
+        self.file = None
+
+    def write_lines(self, lines):
+        start = 0
+        while start < len(lines):
+            if self.file is None:
+                self.open_current()
+            space = self.max_lines - self.line_count
+            if space <= 0:
+                self.close_current()
+                self.file_counter += 1
+                continue
+            chunk = lines[start:start + space]
+            self.file.writelines([line + '\n' for line in chunk])
+            self.line_count += len(chunk)
+            start += len(chunk)
+
+        # Hand the batch to the OS so readers following the file see it
+        if self.file is not None:
+            self.file.flush()
+            if self.fsync == 'batch':
+                os.fsync(self.file.fileno())
+
+    def close(self):
+        self.close_current()
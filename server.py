@@ -1,28 +1,68 @@
 import socket
 import time
 import threading
+import asyncio
+import queue
+import heapq
+import itertools
+import glob
+import signal
 import os
 import re
 import json
 from datetime import datetime
 import argparse
 import configparser
+import wire_format
+import timestamps
+import mmsg
+from rotating_writer import RotatingWriter, FSYNC_POLICIES
 
 class UDPServer:
-    def __init__(self, host='::', port=12345, timeout=30, batch_size=100, max_lines=10000):
+    def __init__(self, host='::', port=12345, timeout=30, batch_size=100, max_lines=10000,
+                 engine='threaded', queue_size=10000, workers=1, exp_dir=None, worker_id=None,
+                 packet_format='text', fsync='never', sessions=False, kernel_timestamps=False,
+                 mmsg_batch=0):
         self.host = host
         self.port = port
         self.timeout = timeout
         self.batch_size = batch_size
         self.max_lines = max_lines
-        self.packets = []
-        self.file_counter = 1
+        self.engine = engine
+        self.queue_size = queue_size
+        self.workers = workers
+        self.worker_id = worker_id
+        self.packet_format = packet_format
+        self.fsync = fsync
+        self.per_session = sessions
+        self.kernel_timestamps = kernel_timestamps
+        self.mmsg_batch = mmsg_batch
+        self.sessions = {}
+        self.closed_sessions = []
+        self.next_session_id = 1
         self.last_received_time = time.time_ns()
         self.lock = threading.Lock()
         self.running = True
         self.received_something = False
         self.total_packets = 0
+        self.malformed_packets = 0
+        self.write_queue = None
+        self.writer_thread = None
+
+        # Workers write their own packets_w<id>_<n>.psv shards into the parent's experiment
+        if worker_id is not None:
+            self.exp_dir = exp_dir
+            self.file_prefix = f'packets_w{worker_id}_'
+            self.config_path = None
+        else:
+            self.file_prefix = 'packets_'
+            self.create_experiment()
+
+        # Without per-session output every sender shares one default session and file sequence
+        self.default_session = Session(0, None, RotatingWriter(self.exp_dir, self.file_prefix, '.psv',
+                                                               self.max_lines, self.fsync))
 
+    def create_experiment(self):
         # Create storage directory if it doesn't exist
         base_dir = 'results_server'
         if not os.path.exists(base_dir):
@@ -42,111 +82,590 @@ class UDPServer:
             "timeout": self.timeout,
             "batch_size": self.batch_size,
             "max_lines": self.max_lines,
+            "engine": self.engine,
+            "queue_size": self.queue_size,
+            "workers": self.workers,
+            "packet_format": self.packet_format,
+            "fsync": self.fsync,
+            "sessions": self.per_session,
+            "kernel_timestamps": self.kernel_timestamps,
+            "mmsg_batch": self.mmsg_batch,
             "experiment_starts": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         }
         self.config_path = os.path.join(self.exp_dir, "server_config.json")
         with open(self.config_path, "w") as f:
             json.dump(self.config_dict, f, indent=4)
 
-        # Start timeout checker
-        threading.Thread(target=self.check_timeout, daemon=True).start()
-
     def check_timeout(self):
         while self.running:
-            if time.time() - self.last_received_time > self.timeout:
+            if self.per_session:
+                # Sessions expire one by one, the server itself keeps running
+                self.evict_idle_sessions()
+            elif time.time() - self.last_received_time > self.timeout:
                 print("Timeout exit [ I heard no one in a while :( ]")
-                self.save_packets(force=True)
-                self.running = False
-                # Log experiment end time
-                self.config_dict["experiment_ends"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                with open(self.config_path, "w") as f:
-                    json.dump(self.config_dict, f, indent=4)
+                self.finish()
                 os._exit(0)
             time.sleep(1)
 
+    def finish(self):
+        self.running = False
+        # Let the writer drain whatever is still queued before the final flush
+        if self.writer_thread is not None:
+            # Only a live writer can take the sentinel off a full queue
+            while self.writer_thread.is_alive():
+                try:
+                    self.write_queue.put(None, timeout=1)
+                    break
+                except queue.Full:
+                    pass
+            self.writer_thread.join()
+        self.save_packets(force=True)
+        with self.lock:
+            self.default_session.writer.close()
+            for session in list(self.sessions.values()):
+                self.close_session(session)
+            if self.per_session:
+                self.log_sessions()
+        if self.malformed_packets:
+            print(f"Dropped {self.malformed_packets} packets not matching the {self.packet_format} format")
+        if self.config_path is not None:
+            self.log_experiment_end()
+
+    def log_experiment_end(self):
+        self.config_dict["experiment_ends"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with open(self.config_path, "w") as f:
+            json.dump(self.config_dict, f, indent=4)
+
+    def session_for(self, addr):
+        if not self.per_session:
+            return self.default_session
+        key = (addr[0], addr[1])
+        session = self.sessions.get(key)
+        if session is None:
+            prefix = f'{self.file_prefix}s{self.next_session_id}_'
+            session = Session(self.next_session_id, key, RotatingWriter(self.exp_dir, prefix, '.psv',
+                                                                        self.max_lines, self.fsync))
+            self.sessions[key] = session
+            self.next_session_id += 1
+            print(f"New session {session.id} from [{key[0]}]:{key[1]}")
+            self.log_sessions()
+        return session
+
+    def store_packet(self, line, addr):
+        # Caller holds self.lock. Returns True once the session has a full batch pending
+        session = self.session_for(addr)
+        session.packets.append(line)
+        session.total_packets += 1
+        session.last_seen = time.time()
+        return len(session.packets) >= self.batch_size
+
+    def close_session(self, session):
+        # Caller holds self.lock
+        if session.packets:
+            session.writer.write_lines(session.packets)
+            session.packets = []
+        session.writer.close()
+        del self.sessions[session.key]
+        self.closed_sessions.append(session.to_dict())
+
+    def evict_idle_sessions(self):
+        # Returns the seconds until the next session could expire
+        now = time.time()
+        next_check = self.timeout
+        with self.lock:
+            evicted = False
+            for session in list(self.sessions.values()):
+                idle = now - session.last_seen
+                if idle > self.timeout:
+                    print(f"Session {session.id} from [{session.host}]:{session.port} idle, "
+                          f"closing after {session.total_packets} packets")
+                    self.close_session(session)
+                    evicted = True
+                else:
+                    next_check = min(next_check, self.timeout - idle)
+            if evicted:
+                self.log_sessions()
+        return max(next_check, 0.1)
+
+    def log_sessions(self):
+        # Caller holds self.lock
+        name = "sessions.json" if self.worker_id is None else f"sessions_w{self.worker_id}.json"
+        active = [session.to_dict() for session in self.sessions.values()]
+        with open(os.path.join(self.exp_dir, name), "w") as f:
+            json.dump(self.closed_sessions + active, f, indent=4)
+
     def save_packets(self, force=False):
         with self.lock:
-            if not self.packets:
+            sessions = list(self.sessions.values()) if self.per_session else [self.default_session]
+            pending = [s for s in sessions if s.packets and (force or len(s.packets) >= self.batch_size)]
+            if not pending:
                 return
 
-            if force or len(self.packets) >= self.batch_size:
-                print("Still receiving packets. Current packet count:", self.total_packets)
-                filename = os.path.join(self.exp_dir, f'packets_{self.file_counter}.psv')
-                line_count = 0
-
-                # Check if current file exists and count lines
-                if os.path.exists(filename):
-                    with open(filename, 'r') as f:
-                        line_count = sum(1 for _ in f)
-
-                # If current file would exceed max_lines, create new file
-                if line_count + len(self.packets) > self.max_lines:
-                    remaining_space = self.max_lines - line_count
-                    self.file_counter += 1
-                    filename = os.path.join(self.exp_dir, f'packets_{self.file_counter}.psv')
-
-                    # Save remaining packets that fit in current file
-                    if remaining_space > 0:
-                        with open(os.path.join(self.exp_dir, f'packets_{self.file_counter-1}.psv'), 'a') as f:
-                            for packet in self.packets[:remaining_space]:
-                                f.write(packet + '\n')
-                        self.packets = self.packets[remaining_space:]
-
-                # Save packets to file
-                with open(filename, 'a') as f:
-                    for packet in self.packets:
-                        f.write(packet + '\n')
-                self.packets = []
-
-    def handle_packet(self, data, addr):
-        current_time = str(time.time_ns())
-        self.total_packets += 1
+            print("Still receiving packets. Current packet count:", self.total_packets)
+            for session in pending:
+                session.writer.write_lines(session.packets)
+                session.packets = []
+
+    def handle_packet(self, data, addr, kernel_time=None):
+        user_time = time.time_ns()
+        # The kernel receive timestamp, when enabled, is what gets echoed
+        current_time = kernel_time or user_time
         client_host = addr[0]
         client_port = addr[1]
+        response_addr = (client_host, client_port, 0, 0)
+
+        if self.packet_format == 'binary':
+            echo = bytearray(data)
+            if not wire_format.stamp_server(echo, len(echo), current_time):
+                self.malformed_packets += 1
+                return
+            modified_data = wire_format.to_psv(wire_format.unpack(echo))
+        else:
+            echo = data + b"|%d" % current_time
+            modified_data = echo.decode('utf-8', errors='replace')
 
+        # Keep the userspace time as a trailing field to measure the interpreter/scheduler delay
+        if self.kernel_timestamps:
+            modified_data += f"|{user_time}"
+
+        self.total_packets += 1
         if not self.received_something:
             self.received_something = True
             print("Packets incoming!")
 
-        modified_data = f"{data.decode('utf-8')}|{current_time}"
-
         # Send response back to the same client port
-        response_addr = (client_host, client_port, 0, 0)
-        self.sock.sendto(modified_data.encode('utf-8'), response_addr)
+        self.sock.sendto(echo, response_addr)
 
         # Store the packet
         with self.lock:
-            self.packets.append(modified_data)
+            full = self.store_packet(modified_data, addr)
             self.last_received_time = time.time()
 
-            if len(self.packets) >= self.batch_size:
+            if full:
                 threading.Thread(target=self.save_packets).start()
 
+    def format_record(self, record):
+        # Queued records are raw text echoes or unpacked binary headers
+        if self.packet_format == 'binary':
+            return wire_format.to_psv(record)
+        # Text engines echo any datagram; bytes that are not UTF-8 are stored as U+FFFD
+        return record.decode('utf-8', errors='replace')
+
+    def writer_loop(self):
+        # Single long-lived writer fed by the hot loop, None means stop. A record that cannot
+        # be stored is counted and dropped: if this thread died, the hot loop would block on
+        # the full queue and nothing after it would be saved
+        while True:
+            item = self.write_queue.get()
+            if item is None:
+                break
+            record, addr = item
+            try:
+                with self.lock:
+                    full = self.store_packet(self.format_record(record), addr)
+                if full:
+                    self.save_packets()
+            except Exception as e:
+                self.malformed_packets += 1
+                print(f"Writer dropped a record: {e!r}")
+
+    def serve_threaded(self):
+        while self.running:
+            try:
+                if self.kernel_timestamps:
+                    data, addr, kernel_time, _ = timestamps.recv(self.sock, 1024)
+                else:
+                    data, addr = self.sock.recvfrom(1024)
+                    kernel_time = None
+                threading.Thread(target=self.handle_packet, args=(data, addr, kernel_time)).start()
+            except socket.error:
+                if self.running:
+                    raise
+
+    def start_writer(self):
+        self.write_queue = queue.Queue(maxsize=self.queue_size)
+        self.writer_thread = threading.Thread(target=self.writer_loop, daemon=True)
+        self.writer_thread.start()
+
+    def packet_echoed(self, record, addr):
+        self.total_packets += 1
+        self.last_received_time = time.time()
+        if not self.received_something:
+            self.received_something = True
+            print("Packets incoming!")
+
+        # Blocks when the writer falls behind instead of dropping records
+        self.write_queue.put((record, addr))
+
+    def serve_loop(self):
+        # Receive, timestamp and echo inline; persistence is left to the writer thread
+        self.start_writer()
+
+        if self.mmsg_batch > 1:
+            self.serve_loop_mmsg()
+            return
+        if self.packet_format == 'binary':
+            self.serve_loop_binary()
+            return
+
+        sock = self.sock
+        kernel = self.kernel_timestamps
+        while self.running:
+            try:
+                if kernel:
+                    data, addr, kernel_time, user_time = timestamps.recv(sock, 1024)
+                    echo = data + b"|%d" % (kernel_time or user_time)
+                else:
+                    data, addr = sock.recvfrom(1024)
+                    echo = data + b"|%d" % time.time_ns()
+                sock.sendto(echo, addr)
+            except socket.error:
+                if self.running:
+                    raise
+                break
+            self.packet_echoed(echo + b"|%d" % user_time if kernel else echo, addr)
+
+    def serve_loop_binary(self):
+        # One preallocated buffer: the timestamp is written in place and the same bytes echoed
+        sock = self.sock
+        kernel = self.kernel_timestamps
+        buf = bytearray(65535)
+        view = memoryview(buf)
+        while self.running:
+            try:
+                if kernel:
+                    nbytes, addr, kernel_time, user_time = timestamps.recv_into(sock, buf)
+                    current_time = kernel_time or user_time
+                else:
+                    nbytes, addr = sock.recvfrom_into(buf)
+                    current_time = time.time_ns()
+                if not wire_format.stamp_server(buf, nbytes, current_time):
+                    self.malformed_packets += 1
+                    continue
+                sock.sendto(view[:nbytes], addr)
+            except socket.error:
+                if self.running:
+                    raise
+                break
+            record = wire_format.unpack(buf)
+            self.packet_echoed(record + (user_time,) if kernel else record, addr)
+
+    def serve_loop_mmsg(self):
+        # Up to mmsg_batch datagrams per recvmmsg, stamped in their receive buffers and
+        # echoed with one sendmmsg. Each packet keeps its own kernel receive timestamp
+        binary = self.packet_format == 'binary'
+        # Text echoes grow by "|<timestamp>", leave room for it after each buffer
+        rx = mmsg.BatchReceiver(self.sock, self.mmsg_batch, 65535 if binary else 1024, 0 if binary else 32)
+        if not rx.kernel_timestamps:
+            print("SO_TIMESTAMPNS not supported here; packets of a batch share one receive time")
+        kernel = self.kernel_timestamps
+        while self.running:
+            records = []
+            try:
+                n = rx.recv()
+                user_time = rx.user_time
+                start = 0
+                for i in range(n):
+                    buf = rx.buffers[i]
+                    nbytes = rx.length(i)
+                    current_time = rx.kernel_time(i) or user_time
+                    if binary:
+                        if not wire_format.stamp_server(buf, nbytes, current_time):
+                            self.malformed_packets += 1
+                            # Echo the run before the bad packet and skip it
+                            rx.send(start, i)
+                            start = i + 1
+                            continue
+                        record = wire_format.unpack(buf)
+                        if kernel:
+                            record += (user_time,)
+                    else:
+                        stamp = b"|%d" % current_time
+                        buf[nbytes:nbytes + len(stamp)] = stamp
+                        rx.set_length(i, nbytes + len(stamp))
+                        record = bytes(buf[:nbytes + len(stamp)])
+                        if kernel:
+                            record += b"|%d" % user_time
+                    records.append((record, rx.address(i)))
+                rx.send(start, n)
+            except socket.error:
+                if self.running:
+                    raise
+                break
+            for record, addr in records:
+                self.packet_echoed(record, addr)
+
+    def check_idle(self, loop, idle_exit):
+        # Timer based equivalent of check_timeout: re-arm until the idle deadline passes
+        if self.per_session:
+            loop.call_later(self.evict_idle_sessions(), self.check_idle, loop, idle_exit)
+            return
+        remaining = self.last_received_time + self.timeout - time.time()
+        if remaining <= 0:
+            print("Timeout exit [ I heard no one in a while :( ]")
+            idle_exit.set_result(None)
+            return
+        loop.call_later(min(remaining, self.timeout), self.check_idle, loop, idle_exit)
+
+    async def serve_asyncio(self):
+        loop = asyncio.get_running_loop()
+        self.start_writer()
+
+        transport, _ = await loop.create_datagram_endpoint(lambda: EchoProtocol(self), sock=self.sock)
+        idle_exit = loop.create_future()
+        self.check_idle(loop, idle_exit)
+        try:
+            await idle_exit
+        finally:
+            transport.close()
+        self.finish()
+
+    def release_idle_worker(self, signum, frame):
+        if not self.received_something:
+            self.last_received_time = 0
+
+    def resolve_options(self, sock):
+        # Fall back from options this engine or platform cannot honour, so the stored
+        # config describes what the run actually does
+        if self.kernel_timestamps:
+            if self.engine == 'asyncio':
+                print("Kernel timestamps need recvmsg, not available with the asyncio engine; using userspace time")
+                self.kernel_timestamps = False
+            elif not timestamps.enable(sock):
+                print("SO_TIMESTAMPNS not supported here; using userspace time")
+                self.kernel_timestamps = False
+        if self.mmsg_batch > 1 and not mmsg.available():
+            print("recvmmsg/sendmmsg not available here; receiving one packet per syscall")
+            self.mmsg_batch = 0
+        # recvmmsg batches always read per-packet kernel times when the socket supports them
+        kernel_rx = self.kernel_timestamps or (self.mmsg_batch > 1 and timestamps.enable(sock))
+        self.rx_timestamps = 'kernel' if kernel_rx else 'user'
+
+    def write_config(self):
+        self.config_dict["kernel_timestamps"] = self.kernel_timestamps
+        self.config_dict["mmsg_batch"] = self.mmsg_batch
+        self.config_dict["rx_timestamps"] = self.rx_timestamps
+        with open(self.config_path, "w") as f:
+            json.dump(self.config_dict, f, indent=4)
+
+    def start_workers(self):
+        print(f"Server starting {self.workers} workers on [{self.host}]:{self.port}")
+        # Resolved once here on a probe socket, the workers inherit the effective options
+        with socket.socket(socket.AF_INET6, socket.SOCK_DGRAM) as probe:
+            self.resolve_options(probe)
+        self.write_config()
+        pids = []
+        for worker_id in range(1, self.workers + 1):
+            pid = os.fork()
+            if pid == 0:
+                worker = UDPServer(
+                    host=self.host,
+                    port=self.port,
+                    timeout=self.timeout,
+                    batch_size=self.batch_size,
+                    max_lines=self.max_lines,
+                    engine=self.engine,
+                    queue_size=self.queue_size,
+                    packet_format=self.packet_format,
+                    fsync=self.fsync,
+                    sessions=self.per_session,
+                    kernel_timestamps=self.kernel_timestamps,
+                    mmsg_batch=self.mmsg_batch,
+                    exp_dir=self.exp_dir,
+                    worker_id=worker_id
+                )
+                try:
+                    worker.start()
+                finally:
+                    os._exit(0)
+            pids.append(pid)
+
+        # Workers flush on their own timeout or Ctrl-C. Once one has timed out, workers
+        # that never got a flow are told to exit instead of waiting forever
+        remaining = set(pids)
+        while remaining:
+            try:
+                pid, _ = os.wait()
+            except KeyboardInterrupt:
+                # Forward in case only the parent got the signal (e.g. kill -INT <pid>)
+                for other in remaining:
+                    os.kill(other, signal.SIGINT)
+                continue
+            remaining.discard(pid)
+            for other in remaining:
+                os.kill(other, signal.SIGUSR1)
+
+        # A session is pinned to one worker by the SO_REUSEPORT hash, its shards need no merge
+        try:
+            if not self.per_session:
+                merged, set_aside = merge_shards(self.exp_dir, self.max_lines)
+                print(f"Merged {merged} packets from {self.workers} worker shards")
+                if set_aside:
+                    print(f"Set aside {set_aside} lines without a server receive time in unmerged_packets.psv")
+        finally:
+            self.log_experiment_end()
+
     def start(self):
+        if self.workers > 1 and self.worker_id is None:
+            self.start_workers()
+            return
+
         self.sock = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM)
         self.sock.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_V6ONLY, 0)
+        if self.worker_id is not None:
+            signal.signal(signal.SIGUSR1, self.release_idle_worker)
+            # Every worker binds the same port, the kernel spreads flows across them
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
         self.sock.bind((self.host, self.port))
-        print(f"Server listening on [{self.host}]:{self.port}")
+        self.resolve_options(self.sock)
+        if self.config_path is not None:
+            self.write_config()
+        if self.worker_id is not None:
+            print(f"Worker {self.worker_id} listening on [{self.host}]:{self.port} ({self.engine} engine)")
+        else:
+            print(f"Server listening on [{self.host}]:{self.port} ({self.engine} engine)")
 
         try:
-            while self.running:
-                try:
-                    data, addr = self.sock.recvfrom(1024)
-                    threading.Thread(target=self.handle_packet, args=(data, addr)).start()
-                except socket.error:
-                    if self.running:
-                        raise
+            if self.engine == 'asyncio':
+                asyncio.run(self.serve_asyncio())
+                return
+
+            # Start timeout checker
+            threading.Thread(target=self.check_timeout, daemon=True).start()
+
+            if self.engine == 'loop':
+                self.serve_loop()
+            else:
+                self.serve_threaded()
         except KeyboardInterrupt:
             print("Server shutting down...")
-            self.running = False
-            self.save_packets(force=True)
-            # Log experiment end time
-            self.config_dict["experiment_ends"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            with open(self.config_path, "w") as f:
-                json.dump(self.config_dict, f, indent=4)
+            if self.worker_id is not None:
+                # Ctrl-C reaches workers directly and again via the parent, flush only once
+                signal.signal(signal.SIGINT, signal.SIG_IGN)
+            self.finish()
         finally:
             self.sock.close()
 
+class Session:
+    def __init__(self, session_id, key, writer):
+        self.id = session_id
+        self.key = key
+        self.host, self.port = key if key is not None else (None, None)
+        self.writer = writer
+        self.packets = []
+        self.total_packets = 0
+        self.first_seen = time.time()
+        self.last_seen = self.first_seen
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "host": self.host,
+            "port": self.port,
+            "packets": self.total_packets,
+            "first_seen": datetime.fromtimestamp(self.first_seen).strftime("%Y-%m-%d %H:%M:%S"),
+            "last_seen": datetime.fromtimestamp(self.last_seen).strftime("%Y-%m-%d %H:%M:%S"),
+            "files": f"{self.writer.prefix}*{self.writer.suffix}",
+        }
+
+class EchoProtocol(asyncio.DatagramProtocol):
+    def __init__(self, server):
+        self.server = server
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        current_time = time.time_ns()
+        if self.server.packet_format == 'binary':
+            echo = bytearray(data)
+            if not wire_format.stamp_server(echo, len(echo), current_time):
+                self.server.malformed_packets += 1
+                return
+            self.transport.sendto(echo, addr)
+            self.server.packet_echoed(wire_format.unpack(echo), addr)
+            return
+
+        echo = data + b"|%d" % current_time
+        self.transport.sendto(echo, addr)
+        self.server.packet_echoed(echo, addr)
+
+    def error_received(self, exc):
+        print(f"Socket error: {exc}")
+
+def shard_lines(paths):
+    for path in paths:
+        with open(path, 'r') as f:
+            yield from f
+
+def server_time(line):
+    return int(line.split('|')[3])
+
+def sorted_runs(exp_dir, paths, run_lines, runs, unmerged):
+    # External sort, first pass: the shards are read run_lines at a time and every run is
+    # sorted by server receive time into its own temporary file, appended to runs as soon as it
+    # exists. The threaded engine writes records out of order (one thread per packet, ad-hoc
+    # flush threads), so shard order cannot be trusted. Text engines store any datagram: lines
+    # without a server receive time go to unmerged instead. Returns how many were set aside
+    set_aside = 0
+    lines = shard_lines(paths)
+    while True:
+        run = []
+        for line in itertools.islice(lines, run_lines):
+            line = line if line.endswith('\n') else line + '\n'
+            try:
+                run.append((server_time(line), line))
+            except (IndexError, ValueError):
+                unmerged.write(line)
+                set_aside += 1
+        if not run:
+            break
+        run.sort(key=lambda item: item[0])
+        path = os.path.join(exp_dir, f'.merge_run_{len(runs) + 1}.psv')
+        runs.append(path)
+        with open(path, 'w') as f:
+            f.writelines(line for _, line in run)
+    return set_aside
+
+def merge_shards(exp_dir, max_lines, run_lines=1_000_000):
+    # Sorted runs of all worker shards, then a streaming k-way merge into one global order by
+    # server receive time. Memory is bounded by run_lines whatever the length of the experiment.
+    # Returns (merged, set aside) line counts; the set-aside lines are kept in unmerged_packets.psv
+    shards = []
+    for path in glob.glob(os.path.join(exp_dir, 'packets_w*_*.psv')):
+        match = re.search(r'packets_w(\d+)_(\d+)\.psv$', path)
+        if match:
+            shards.append((int(match.group(1)), int(match.group(2)), path))
+
+    runs = []
+    unmerged_path = os.path.join(exp_dir, 'unmerged_packets.psv')
+    try:
+        with open(unmerged_path, 'w') as unmerged:
+            set_aside = sorted_runs(exp_dir, [path for _, _, path in sorted(shards)], run_lines, runs, unmerged)
+        if not set_aside:
+            os.remove(unmerged_path)
+
+        streams = [shard_lines([path]) for path in runs]
+        merged = heapq.merge(*streams, key=server_time)
+
+        writer = RotatingWriter(exp_dir, 'packets_', '.psv', max_lines)
+        total = 0
+        batch = []
+        for line in merged:
+            batch.append(line.rstrip('\n'))
+            if len(batch) >= 10000:
+                writer.write_lines(batch)
+                total += len(batch)
+                batch = []
+        writer.write_lines(batch)
+        total += len(batch)
+        writer.close()
+    finally:
+        for path in runs:
+            if os.path.exists(path):
+                os.remove(path)
+    return total, set_aside
+
 def load_config(config_file):
     config = configparser.ConfigParser()
     config.read(config_file)
@@ -158,6 +677,14 @@ def load_config(config_file):
         if 'timeout' in s: cfg['timeout'] = int(s['timeout'])
         if 'batch_size' in s: cfg['batch_size'] = int(s['batch_size'])
         if 'max_lines' in s: cfg['max_lines'] = int(s['max_lines'])
+        if 'engine' in s: cfg['engine'] = s['engine']
+        if 'queue_size' in s: cfg['queue_size'] = int(s['queue_size'])
+        if 'workers' in s: cfg['workers'] = int(s['workers'])
+        if 'packet_format' in s: cfg['packet_format'] = s['packet_format']
+        if 'fsync' in s: cfg['fsync'] = s['fsync']
+        if 'sessions' in s: cfg['sessions'] = s.getboolean('sessions')
+        if 'kernel_timestamps' in s: cfg['kernel_timestamps'] = s.getboolean('kernel_timestamps')
+        if 'mmsg_batch' in s: cfg['mmsg_batch'] = int(s['mmsg_batch'])
     return cfg
 
 if __name__ == "__main__":
@@ -168,6 +695,22 @@ if __name__ == "__main__":
     parser.add_argument('--timeout', type=int, help='Timeout in seconds')
     parser.add_argument('--batch-size', type=int, help='Batch size for saving packets')
     parser.add_argument('--max-lines', type=int, help='Max lines per file')
+    parser.add_argument('--engine', type=str, choices=['threaded', 'loop', 'asyncio'],
+                        help='threaded: one thread per packet, loop: inline echo loop plus a single writer thread, '
+                             'asyncio: datagram endpoint on an event loop plus a single writer thread')
+    parser.add_argument('--queue-size', type=int, help='Max packets buffered for the writer thread (loop/asyncio engines)')
+    parser.add_argument('--workers', type=int, help='Worker processes sharing the port via SO_REUSEPORT')
+    parser.add_argument('--packet-format', type=str, choices=wire_format.FORMATS,
+                        help='text: pipe separated strings, binary: fixed-width uint64 fields')
+    parser.add_argument('--fsync', type=str, choices=FSYNC_POLICIES,
+                        help='When to fsync output files: never, after every batch, or on rotation')
+    parser.add_argument('--sessions', action='store_true', default=None,
+                        help='Track each client (addr, port) as a session with its own output shards; '
+                             'idle sessions are closed individually and the server keeps running')
+    parser.add_argument('--kernel-timestamps', action='store_true', default=None,
+                        help='Stamp packets with kernel receive time (SO_TIMESTAMPNS) and also store the userspace time')
+    parser.add_argument('--mmsg-batch', type=int,
+                        help='Receive and echo up to N packets per recvmmsg/sendmmsg syscall (loop engine)')
     args = parser.parse_args()
 
     config = {}
@@ -180,12 +723,31 @@ if __name__ == "__main__":
     timeout = args.timeout or config.get('timeout', 60)
     batch_size = args.batch_size or config.get('batch_size', 100)
     max_lines = args.max_lines or config.get('max_lines', 10000)
+    engine = args.engine or config.get('engine', 'threaded')
+    queue_size = args.queue_size or config.get('queue_size', 10000)
+    workers = args.workers or config.get('workers', 1)
+    packet_format = args.packet_format or config.get('packet_format', 'text')
+    fsync = args.fsync or config.get('fsync', 'never')
+    sessions = args.sessions or config.get('sessions', False)
+    kernel_timestamps = args.kernel_timestamps or config.get('kernel_timestamps', False)
+    mmsg_batch = args.mmsg_batch or config.get('mmsg_batch', 0)
+
+    if mmsg_batch > 1 and engine != 'loop':
+        parser.error("--mmsg-batch requires --engine loop")
 
     server = UDPServer(
         host=host,
         port=port,
         timeout=timeout,
         batch_size=batch_size,
-        max_lines=max_lines
+        max_lines=max_lines,
+        engine=engine,
+        queue_size=queue_size,
+        workers=workers,
+        packet_format=packet_format,
+        fsync=fsync,
+        sessions=sessions,
+        kernel_timestamps=kernel_timestamps,
+        mmsg_batch=mmsg_batch
     )
     server.start()
\ No newline at end of file
@@ -0,0 +1,38 @@
+import socket
+import struct
+import time
+
+# Kernel software receive timestamps (SO_TIMESTAMPNS) read from recvmsg ancillary data.
+# Linux only; callers fall back to time.time_ns() when they are unavailable.
+SO_TIMESTAMPNS = getattr(socket, 'SO_TIMESTAMPNS', 35)
+SCM_TIMESTAMPNS = getattr(socket, 'SCM_TIMESTAMPNS', SO_TIMESTAMPNS)
+TIMESPEC = struct.Struct('@ll')  # tv_sec, tv_nsec
+ANCBUFSIZE = socket.CMSG_SPACE(TIMESPEC.size) if hasattr(socket, 'CMSG_SPACE') else 0
+
+def enable(sock):
+    if not ANCBUFSIZE:
+        return False
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, SO_TIMESTAMPNS, 1)
+    except OSError:
+        return False
+    return True
+
+def from_ancdata(ancdata):
+    for level, kind, data in ancdata:
+        if level == socket.SOL_SOCKET and kind == SCM_TIMESTAMPNS and len(data) >= TIMESPEC.size:
+            sec, nsec = TIMESPEC.unpack_from(data)
+            return sec * 1_000_000_000 + nsec
+    return None
+
+def recv(sock, bufsize):
+    # (data, addr, kernel_ns or None, user_ns)
+    data, ancdata, _, addr = sock.recvmsg(bufsize, ANCBUFSIZE)
+    user_ns = time.time_ns()
+    return data, addr, from_ancdata(ancdata), user_ns
+
+def recv_into(sock, buf):
+    # (nbytes, addr, kernel_ns or None, user_ns)
+    nbytes, ancdata, _, addr = sock.recvmsg_into([buf], ANCBUFSIZE)
+    user_ns = time.time_ns()
+    return nbytes, addr, from_ancdata(ancdata), user_ns
@@ -0,0 +1,52 @@
+import struct
+
+# Binary wire format, version 1 (network byte order, 32 byte header):
+#   version (uint8) | reserved (7 bytes) | seq (uint64) | t_client_send (uint64) | t_server_recv (uint64)
+# followed by padding up to the configured packet size. The server writes its
+# receive timestamp in place at SERVER_TIME_OFFSET and echoes the same buffer back.
+VERSION = 1
+HEADER = struct.Struct('!B7xQQQ')
+SERVER_TIME = struct.Struct('!Q')
+SERVER_TIME_OFFSET = 24
+MIN_PACKET_SIZE = HEADER.size
+
+FORMATS = ('text', 'binary')
+
+def new_packet(packet_size, padding=b''):
+    if packet_size < MIN_PACKET_SIZE:
+        raise ValueError(f"packet_size must be at least {MIN_PACKET_SIZE} bytes")
+    buf = bytearray(packet_size)
+    fill = padding[:packet_size - MIN_PACKET_SIZE]
+    buf[MIN_PACKET_SIZE:MIN_PACKET_SIZE + len(fill)] = fill
+    return buf
+
+def stamp_client(buf, seq, t_client_send):
+    HEADER.pack_into(buf, 0, VERSION, seq, t_client_send, 0)
+
+def stamp_server(buf, nbytes, t_server_recv):
+    # Returns False for datagrams that are not version 1 binary packets
+    if nbytes < MIN_PACKET_SIZE or buf[0] != VERSION:
+        return False
+    SERVER_TIME.pack_into(buf, SERVER_TIME_OFFSET, t_server_recv)
+    return True
+
+def unpack(buf):
+    # (seq, t_client_send, t_server_recv)
+    return HEADER.unpack_from(buf)[1:]
+
+def unpack_text(data):
+    # (seq, t_client_send, t_server_recv) from a text echo "seq|t_send|payload|t_server"
+    parts = data.split(b'|')
+    return int(parts[0]), int(parts[1]), int(parts[3])
+
+def to_psv(record):
+    # Same field layout as text packets, with an empty payload field. Extra
+    # trailing fields (e.g. a userspace timestamp) are appended as is
+    seq, t_client_send, t_server_recv, *extra = record
+    line = f"{seq}|{t_client_send}||{t_server_recv}"
+    return line + "".join(f"|{value}" for value in extra)
+
+def to_csv(record, t_client_recv, *extra):
+    seq, t_client_send, t_server_recv = record
+    line = f"{seq},{t_client_send},,{t_server_recv},{t_client_recv}"
+    return line + "".join(f",{value}" for value in extra)